@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the revolut and revolut_bot packages, on fixed synthetic
+datasets (no network). The results are written as JSON, to compare them
+between releases.
+
+Usage : python benchmarks/bench_revolut.py --help
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT_DIR)
+
+import revolut  # noqa: E402
+from revolut import Amount, AccountTransactions, Revolut  # noqa: E402
+import revolut_bot  # noqa: E402
+import revolutbot  # noqa: E402
+
+_DEFAULT_SIZES = "1000,100000,1000000"
+_DEFAULT_HISTORY_SIZES = "1000,100000"
+_DEFAULT_REPEAT = 3
+_PAGE_SIZE = 50
+_CURRENCIES = ["EUR", "USD", "GBP", "BTC"]
+_STATES = ["COMPLETED"] * 7 + ["PENDING", "DECLINED", "REVERTED"]
+_ENTRY_POINTS = ["revolut_cli.py", "revolutbot.py", "revolut_transactions.py"]
+
+
+def build_raw_transactions(size):
+    """ Fixed synthetic transactions, the most recent first """
+    end_date = 1577836800000  # 01/01/2020
+    return [{
+        "id": "transaction_{}".format(i),
+        "type": "CARD_PAYMENT",
+        "state": _STATES[i % len(_STATES)],
+        "startedDate": end_date - i * 60000,
+        "completedDate": end_date - i * 60000,
+        "amount": -(i * 7919 % 100000),
+        "fee": 0,
+        "currency": _CURRENCIES[i % len(_CURRENCIES)],
+        "description": "Payment #{}".format(i),
+        "account": {"id": "account_{}".format(i % 4)},
+    } for i in range(size)]
+
+
+def write_history_file(filename, size):
+    """ Fixed synthetic exchange history (revolut_bot csv format) """
+    with open(filename, "w") as f:
+        f.write(",".join(revolut_bot._CSV_COLUMNS) + "\n")
+        for i in range(size):
+            day, month = i % 28 + 1, i % 12 + 1
+            if i % 2:
+                f.write("{:02d}/{:02d}/2018,09:00:00,86.66,EUR,102.00,USD\n"
+                        .format(day, month))
+            else:
+                f.write("{:02d}/{:02d}/2018,09:00:00,100.00,USD,86.66,EUR\n"
+                        .format(day, month))
+
+
+class _StubResponse:
+    status_code = 200
+    headers = {}
+    text = ""
+
+    def __init__(self, content):
+        self.content = content
+
+
+class _StubSession:
+    """ Serve pre-encoded transactions pages, without any network """
+    def __init__(self, raw_transactions):
+        self.pages = {}
+        to_date = None
+        for start in range(0, len(raw_transactions), _PAGE_SIZE):
+            page = raw_transactions[start:start + _PAGE_SIZE]
+            self.pages[to_date] = json.dumps(page).encode("utf-8")
+            to_date = page[-1]["startedDate"]
+        self.pages[to_date] = b"[]"
+
+    def request(self, method, url, params=None, **kwargs):
+        return _StubResponse(self.pages[(params or {}).get("to")])
+
+
+class _StubRevolut:
+    """ Revolut.quote without any network, for the bot decision """
+    def quote(self, from_amount, to_currency):
+        return Amount(real_amount=from_amount.real_amount * 1.2,
+                      currency=to_currency)
+
+
+def timeit(func, repeat):
+    """ Best time (in seconds) of repeat runs """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_transactions(sizes, repeat):
+    for size in sizes:
+        raw_transactions = build_raw_transactions(size)
+        yield ("AccountTransactions", size, timeit(
+            lambda: AccountTransactions(raw_transactions), repeat))
+
+        account_transactions = AccountTransactions(raw_transactions)
+        for lang in ["fr", "en"]:
+            yield ("AccountTransactions.csv[{}]".format(lang), size, timeit(
+                lambda: account_transactions.csv(lang=lang), repeat))
+        del account_transactions
+
+        rev = Revolut(token="token", device_id="device_id")
+        rev.client.session = _StubSession(raw_transactions)
+        yield ("Revolut.get_account_transactions", size, timeit(
+            rev.get_account_transactions, repeat))
+
+
+def bench_bot(history_sizes, repeat):
+    for size in history_sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "exchange_history.csv")
+            write_history_file(filename, size)
+            yield ("revolut_bot.get_last_transactions_from_csv", size,
+                   timeit(lambda: revolut_bot.get_last_transactions_from_csv(
+                       filename=filename), repeat))
+            yield ("revolut_bot.get_last_transaction", size,
+                   timeit(lambda: revolut_bot.get_last_transaction(
+                       filename=filename), repeat))
+
+            def decide():
+                try:
+                    revolutbot.to_buy_or_not_to_buy(
+                        revolut=_StubRevolut(), simulate=True,
+                        filename=filename, forceexchange=False)
+                except SystemExit:
+                    pass  # The decision is returned as the exit code
+            yield ("revolutbot.to_buy_or_not_to_buy", size,
+                   timeit(decide, repeat))
+
+
+def get_import_times(args):
+    """ Run python -X importtime with args, returns a dict
+    {top level module: cumulative import time (s)} """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args, cwd=_ROOT_DIR,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True).stderr
+    import_times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            import_times[name.strip()] = int(cumulative) / 1e6
+    return import_times
+
+
+def bench_startup(repeat):
+    """ Startup of the CLI tools (--help, no request), the modules imported
+    by the interpreter itself (ex : site) excluded from the import time """
+    interpreter_modules = set(get_import_times(["-c", "pass"]))
+    for script in _ENTRY_POINTS:
+        args = [script, "--help"]
+        yield ("{} --help".format(script), None, timeit(
+            lambda: subprocess.run(
+                [sys.executable] + args, cwd=_ROOT_DIR, check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+            repeat))
+
+        def import_time():
+            return sum(seconds for name, seconds
+                       in get_import_times(args).items()
+                       if name not in interpreter_modules)
+        yield ("{} imports (-X importtime)".format(script), None,
+               min(import_time() for _ in range(repeat)))
+
+
+@click.command()
+@click.option('--sizes', default=_DEFAULT_SIZES,
+              help='numbers of transactions, comma separated')
+@click.option('--history-sizes', default=_DEFAULT_HISTORY_SIZES,
+              help='numbers of rows of the exchange history files')
+@click.option('--repeat', '-r', type=int, default=_DEFAULT_REPEAT,
+              help='runs per benchmark (the best one is kept)')
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='JSON output file (default : stdout)')
+def main(sizes, history_sizes, repeat, output):
+    """ Run the benchmarks and write the results as JSON """
+    sizes = [int(size) for size in sizes.split(",") if size]
+    history_sizes = [int(size) for size in history_sizes.split(",") if size]
+    results = []
+    for benchmarks in [bench_transactions(sizes, repeat),
+                       bench_bot(history_sizes, repeat),
+                       bench_startup(repeat)]:
+        for name, size, seconds in benchmarks:
+            print("{:<50} {!s:>9} {:>10.4f} s".format(
+                name, "" if size is None else size, seconds), file=sys.stderr)
+            results.append({"name": name, "size": size, "seconds": seconds})
+
+    json.dump({
+        "revolut_version": revolut.__version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }, output, indent=2)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
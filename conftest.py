@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+# The doctests of the modules needing the optional dependencies
+# (pip3 install revolut[analytics]) are skipped when they are not installed
+try:
+    import numpy  # noqa: F401
+except ImportError:
+    collect_ignore = ["revolut/table.py", "revolut_bot/backtest.py"]
@@ -3,21 +3,52 @@
 This package allows you to communicate with your Revolut accounts
 """
 
-import base64
+import bisect
+from collections import OrderedDict
 from datetime import datetime
-import json
-import requests
-from urllib.parse import urljoin
+from datetime import timedelta
+import importlib
+import io
+import random
+import threading
+import time
+from urllib.parse import urljoin, urlparse
+
+# requests, json, base64, concurrent.futures and email.utils are slow to
+# import : they are imported where they are used, so that the CLI tools
+# start fast when they do not send any request (ex : --help, --version)
 
 __version__ = '0.1.4'  # Should be the same in setup.py
 
 API_BASE = "https://api.revolut.com"
-_URL_GET_ACCOUNTS = API_BASE + "/user/current/wallet"
-_URL_GET_TRANSACTIONS_LAST = API_BASE + "/user/current/transactions/last"
-_URL_QUOTE = API_BASE + "/quote/"
-_URL_EXCHANGE = API_BASE + "/exchange"
-_URL_GET_TOKEN_STEP1 = API_BASE + "/signin"
-_URL_GET_TOKEN_STEP2 = API_BASE + "/signin/confirm"
+# Relative to the api_base of the Client
+_URL_GET_ACCOUNTS = "/user/current/wallet"
+_URL_GET_TRANSACTIONS_LAST = "/user/current/transactions/last"
+_URL_QUOTE = "/quote/"
+_URL_EXCHANGE = "/exchange"
+_URL_GET_TOKEN_STEP1 = "/signin"
+_URL_GET_TOKEN_STEP2 = "/signin/confirm"
+_URL_BIOMETRIC_SELFIE = "/biometric-signin/selfie"
+_URL_BIOMETRIC_CONFIRM = "/biometric-signin/confirm/"
+
+_DEFAULT_MAX_CONCURRENCY = 10  # Default size of the connection pool
+
+# Fastest JSON backends first, "json" (stdlib) is always available
+_JSON_BACKENDS = ["orjson", "ujson", "json"]
+
+# Transient errors : retried with an exponential backoff
+_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+_DEFAULT_MAX_RETRIES = 3
+_DEFAULT_BACKOFF_FACTOR = 0.5  # seconds
+_DEFAULT_MAX_BACKOFF = 30  # seconds
+
+_DEFAULT_WALLET_TTL = 5  # seconds
+
+# Time windows paged in parallel by get_account_transactions(max_workers=N)
+_DEFAULT_TRANSACTIONS_WINDOW = timedelta(days=30)
+
+_DEFAULT_QUOTE_TTL = 10  # seconds
+_DEFAULT_QUOTE_CACHE_SIZE = 256
 
 _DEFAULT_TOKEN_FOR_SIGNIN = "QXBwOlM5V1VuU0ZCeTY3Z1dhbjc="
 
@@ -28,6 +59,7 @@ _AVAILABLE_CURRENCIES = ["USD", "RON", "HUF", "CZK", "GBP", "CAD", "THB",
                          "LTC", "SAR", "RUB", "RSD", "MXN", "ISK", "HRK",
                          "BGN", "XAU", "IDR", "INR", "MYR", "PHP", "XLM",
                          "EOS", "OMG", "XTZ", "ZRX"]
+_AVAILABLE_CURRENCIES_SET = frozenset(_AVAILABLE_CURRENCIES)
 
 _VAULT_ACCOUNT_TYPE = "SAVINGS"
 _ACTIVE_ACCOUNT = "ACTIVE"
@@ -36,6 +68,17 @@ _TRANSACTION_FAILED = "FAILED"
 _TRANSACTION_PENDING = "PENDING"
 _TRANSACTION_REVERTED = "REVERTED"
 _TRANSACTION_DECLINED = "DECLINED"
+# Not exported in the csv files
+_CSV_EXCLUDED_STATES = (_TRANSACTION_DECLINED, _TRANSACTION_FAILED,
+                        _TRANSACTION_REVERTED)
+
+# Indexed fields of AccountTransactions, see AccountTransactions.where
+_INDEXED_FIELDS = {
+    "state": lambda tr: tr.state,
+    "transactions_type": lambda tr: tr.transactions_type,
+    "currency": lambda tr: tr.amount.currency,
+    "account_id": lambda tr: tr.account_id,
+}
 
 
 # The amounts are stored as integer on Revolut.
@@ -53,8 +96,12 @@ _SCALE_FACTOR_CURRENCY_DICT = {
 
 class Amount:
     """ Class to handle the Revolut amount with currencies """
+    # Only the Revolut amount is computed at init :
+    # real_amount and real_amount_str are computed on demand
+    __slots__ = ("currency", "revolut_amount", "_real_amount")
+
     def __init__(self, currency, revolut_amount=None, real_amount=None):
-        if currency not in _AVAILABLE_CURRENCIES:
+        if currency not in _AVAILABLE_CURRENCIES_SET:
             raise KeyError(currency)
         self.currency = currency
 
@@ -62,17 +109,25 @@ class Amount:
             if type(revolut_amount) != int:
                 raise TypeError(type(revolut_amount))
             self.revolut_amount = revolut_amount
-            self.real_amount = self.get_real_amount()
+            self._real_amount = None
 
         elif real_amount is not None:
             if type(real_amount) not in [float, int]:
                 raise TypeError(type(real_amount))
-            self.real_amount = float(real_amount)
+            self._real_amount = float(real_amount)
             self.revolut_amount = self.get_revolut_amount()
         else:
             raise ValueError("revolut_amount or real_amount must be set")
 
-        self.real_amount_str = self.get_real_amount_str()
+    @property
+    def real_amount(self):
+        if self._real_amount is None:
+            self._real_amount = self.get_real_amount()
+        return self._real_amount
+
+    @property
+    def real_amount_str(self):
+        return self.get_real_amount_str()
 
     def get_real_amount_str(self):
         """ Get the real amount with the proper format, without currency """
@@ -90,6 +145,20 @@ class Amount:
         return("Amount(real_amount={}, currency='{}')".format(
             self.real_amount, self.currency))
 
+    def __eq__(self, other):
+        """ Amounts are equal with the same currency and Revolut amount
+        >>> one_euro = Amount(real_amount=1, currency="EUR")
+        >>> one_euro == Amount(revolut_amount=100, currency="EUR")
+        True
+        """
+        if type(other) != Amount:
+            return NotImplemented
+        return (self.currency, self.revolut_amount) == \
+            (other.currency, other.revolut_amount)
+
+    def __hash__(self):
+        return hash((self.currency, self.revolut_amount))
+
     def get_real_amount(self):
         """ Get the real amount from a Revolut amount
         >>> a = Amount(revolut_amount=100, currency="EUR")
@@ -113,6 +182,8 @@ class Amount:
 
 class Transaction:
     """ Class to handle an exchange transaction """
+    __slots__ = ("from_amount", "to_amount", "date")
+
     def __init__(self, from_amount, to_amount, date):
         if type(from_amount) != Amount:
             raise TypeError
@@ -130,165 +201,673 @@ class Transaction:
                                       self.to_amount))
 
 
+class QuoteCache:
+    """ Cache the quotes for a few seconds, with a LRU size limit
+
+    ttl is the default time to live in seconds, and pair_ttl a dict
+    {(from_currency, to_currency): ttl} to override it for some pairs.
+    If scale_amount is set, the last rate of a pair is reused for any
+    amount, instead of caching each amount separately.
+
+    >>> cache = QuoteCache(scale_amount=True)
+    >>> cache.set(Amount(real_amount=10, currency="EUR"), "USD",
+    ...           Amount(real_amount=11, currency="USD"))
+    >>> print(cache.get(Amount(real_amount=20, currency="EUR"), "USD"))
+    22.00 USD
+    >>> print(cache.get(Amount(real_amount=20, currency="EUR"), "GBP"))
+    None
+    >>> cache.hits, cache.misses
+    (1, 1)
+    """
+    def __init__(self, ttl=_DEFAULT_QUOTE_TTL,
+                 max_size=_DEFAULT_QUOTE_CACHE_SIZE,
+                 pair_ttl=None, scale_amount=False):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.pair_ttl = pair_ttl or {}
+        self.scale_amount = scale_amount
+        self.hits = 0
+        self.misses = 0
+        # key => (from revolut_amount, to revolut_amount, timestamp)
+        self._quotes = OrderedDict()
+        self._lock = threading.Lock()  # quote_many shares the cache
+
+    def __len__(self):
+        return len(self._quotes)
+
+    def _get_key(self, from_amount, to_currency):
+        if self.scale_amount:
+            return (from_amount.currency, to_currency)
+        return (from_amount.currency, to_currency, from_amount.revolut_amount)
+
+    def get_ttl(self, from_currency, to_currency):
+        """ Get the time to live of a pair, in seconds """
+        return self.pair_ttl.get((from_currency, to_currency), self.ttl)
+
+    def get(self, from_amount, to_currency):
+        """ Get the cached quote, or None if missing or expired """
+        key = self._get_key(from_amount, to_currency)
+        with self._lock:
+            cached = self._quotes.get(key)
+            ttl = self.get_ttl(from_amount.currency, to_currency)
+            if cached is None or time.monotonic() - cached[2] >= ttl:
+                self.misses += 1
+                return None
+            self._quotes.move_to_end(key)
+            self.hits += 1
+
+        cached_from, cached_to, _ = cached
+        if cached_from != from_amount.revolut_amount:
+            # Only with scale_amount : apply the cached rate
+            cached_to = int(round(
+                cached_to * from_amount.revolut_amount / cached_from))
+        return Amount(revolut_amount=cached_to, currency=to_currency)
+
+    def set(self, from_amount, to_currency, quote):
+        """ Store a quote, evicting the least recently used ones """
+        if self.scale_amount and from_amount.revolut_amount == 0:
+            return  # No rate can be derived from a zero amount
+        key = self._get_key(from_amount, to_currency)
+        with self._lock:
+            self._quotes[key] = (from_amount.revolut_amount,
+                                 quote.revolut_amount,
+                                 time.monotonic())
+            self._quotes.move_to_end(key)
+            while len(self._quotes) > self.max_size:
+                self._quotes.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._quotes.clear()
+
+
+class JsonBackend:
+    """ Class to decode and encode JSON with the stdlib json module,
+    or with a faster optional one (orjson, ujson).
+    With no name, the fastest one installed is used
+
+    >>> JsonBackend("json").dumps({"a": [1, 2]})
+    '{"a": [1, 2]}'
+    >>> JsonBackend("json").loads(b'{"a": [1, 2]}')
+    {'a': [1, 2]}
+    """
+    def __init__(self, name=None):
+        for backend_name in [name] if name else _JSON_BACKENDS:
+            try:
+                self.module = importlib.import_module(backend_name)
+            except ImportError:
+                if name:
+                    raise
+                continue
+            self.name = backend_name
+            break
+
+    def loads(self, json_str):
+        """ Decode a JSON str or bytes """
+        return self.module.loads(json_str)
+
+    def dumps(self, obj):
+        """ Encode an object to a JSON str """
+        json_str = self.module.dumps(obj)
+        if isinstance(json_str, bytes):  # orjson
+            json_str = json_str.decode("utf-8")
+        return json_str
+
+
+class RetryPolicy:
+    """ Class to decide if and when a failed request is retried
+
+    A GET is retried on the transient status codes (429, 5xx),
+    a POST only on 429 (the server did not process it).
+    The delay is taken from the Retry-After header if any, otherwise it is
+    an exponential backoff (with a random jitter) of at most max_backoff.
+    A Retry-After above max_backoff is not waited : ConnectionError
+
+    >>> policy = RetryPolicy(backoff_factor=1, jitter=False)
+    >>> [policy.get_backoff(attempt) for attempt in range(4)]
+    [1, 2, 4, 8]
+    >>> policy.is_retryable("GET", 503), policy.is_retryable("POST", 503)
+    (True, False)
+    """
+    def __init__(self, max_retries=_DEFAULT_MAX_RETRIES,
+                 backoff_factor=_DEFAULT_BACKOFF_FACTOR,
+                 max_backoff=_DEFAULT_MAX_BACKOFF,
+                 retry_status_codes=_RETRY_STATUS_CODES,
+                 jitter=True):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_status_codes = retry_status_codes
+        self.jitter = jitter
+
+    def is_retryable(self, method, status_code):
+        if status_code not in self.retry_status_codes:
+            return False
+        return method == "GET" or status_code == 429
+
+    def get_backoff(self, attempt):
+        """ Get the exponential backoff (in seconds) after attempt n """
+        backoff = min(self.max_backoff, self.backoff_factor * 2 ** attempt)
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+    def get_delay(self, attempt, ret):
+        """ Get the delay (in seconds) before retrying a response.
+        Raises ConnectionError if the server asks to wait longer than
+        max_backoff (an earlier retry would be refused too) """
+        retry_after = ret.headers.get("Retry-After")
+        if retry_after:
+            delay = None
+            try:
+                delay = max(0, float(retry_after))
+            except ValueError:
+                try:
+                    from email.utils import parsedate_to_datetime
+                    retry_date = parsedate_to_datetime(retry_after)
+                    delay = max(0, retry_date.timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass  # Invalid header : use the backoff instead
+            if delay is not None:
+                if delay > self.max_backoff:
+                    raise ConnectionError(
+                        'Retry-After of {:.0f} s, above max_backoff '
+                        '({} s)'.format(delay, self.max_backoff))
+                return delay
+        return self.get_backoff(attempt)
+
+
+class RateLimiter:
+    """ Token bucket to send at most `rate` requests per second on average,
+    with bursts of up to `burst` requests. It can be shared by threads.
+    pause() holds every request, ex : when the server is throttling
+
+    >>> limiter = RateLimiter(rate=1000, burst=2)
+    >>> limiter.acquire(), limiter.acquire()
+    (0, 0)
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last_time = time.monotonic()
+        self._resume_time = self._last_time
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Wait until a request can be sent,
+        returns the time waited (in seconds) """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._last_time) * self.rate)
+            self._last_time = now
+            # A negative number of tokens reserves the next ones
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+            wait = max(wait, self._resume_time - now)
+        waited = 0
+        while wait > 0:
+            time.sleep(wait)
+            waited += wait
+            # The limiter may have been paused during the sleep
+            with self._lock:
+                wait = self._resume_time - time.monotonic()
+        return waited
+
+    def pause(self, delay):
+        """ Hold the requests of every thread for delay seconds """
+        with self._lock:
+            self._resume_time = max(self._resume_time,
+                                    time.monotonic() + delay)
+
+
 class Client:
     """ Do the requests with the Revolut servers """
-    def __init__(self, token, device_id):
-        self.session = requests.session()
-        self.session.headers = {
-                    'Host': 'api.revolut.com',
+    def __init__(self, token, device_id, json_backend=None,
+                 retry_policy=None, rate_limiter=None, api_base=API_BASE,
+                 hooks=None):
+        if not isinstance(json_backend, JsonBackend):
+            json_backend = JsonBackend(json_backend)
+        self.json_backend = json_backend
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter  # Optional RateLimiter
+        self.hooks = list(hooks or [])  # RequestHook objects
+        self.api_base = api_base.rstrip("/")
+        self.headers = {
+                    'Host': urlparse(self.api_base).netloc,
                     'X-Api-Version': '1',
                     'X-Client-Version': '6.34.3',
                     'X-Device-Id': device_id,
                     'User-Agent': 'Revolut/5.5 500500250 (CLI; Android 4.4.2)',
                     'Authorization': 'Basic '+token,
                     }
+        self._session = None
+        self._pool_size = _DEFAULT_MAX_CONCURRENCY
+
+    @property
+    def session(self):
+        """ requests session, created at the first request """
+        if self._session is None:
+            import requests
+            self._session = requests.session()
+            self._session.headers = self.headers
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+        self._pool_size = _DEFAULT_MAX_CONCURRENCY
+
+    def _ensure_pool_size(self, pool_size):
+        """ Keep up to pool_size connections open in the session (one per
+        thread sending requests), else the connections above the pool size
+        are closed after each request, and opened again """
+        if pool_size > self._pool_size:
+            from requests.adapters import HTTPAdapter
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+            self._pool_size = pool_size
+
+    def _decode(self, ret):
+        """ Decode the JSON content of a response """
+        return self.json_backend.loads(ret.content)
 
     def _get(self, url, *, expected_status_code=200, **kwargs):
-        ret = self.session.get(url=url, **kwargs)
-        if ret.status_code != expected_status_code:
-            raise ConnectionError(
-                'Status code {} for url {}\n{}'.format(
-                    ret.status_code, url, ret.text))
-        return ret
+        return self._request("GET", url,
+                             expected_status_code=expected_status_code,
+                             **kwargs)
 
     def _post(self, url, *, expected_status_code=200, **kwargs):
-        ret = self.session.post(url=url, **kwargs)
-        if ret.status_code != expected_status_code:
-            raise ConnectionError(
-                'Status code {} for url {}\n{}'.format(
-                    ret.status_code, url, ret.text))
-        return ret
+        if "json" in kwargs:
+            kwargs["data"] = self.json_backend.dumps(kwargs.pop("json"))
+            kwargs["headers"] = dict(kwargs.get("headers") or {},
+                                     **{"Content-Type": "application/json"})
+        return self._request("POST", url,
+                             expected_status_code=expected_status_code,
+                             **kwargs)
+
+    def _request(self, method, url, *, expected_status_code=200, **kwargs):
+        """ Send a request, retrying the transient errors """
+        endpoint = _get_endpoint_template(url)
+        for hook in self.hooks:
+            hook.before_request(method=method, endpoint=endpoint)
+        if url.startswith("/"):
+            url = self.api_base + url
+        start_time = time.perf_counter()
+        attempt = 0
+        ret = None
+        try:
+            while True:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+                ret = self.session.request(method, url=url, **kwargs)
+                if ret.status_code == expected_status_code:
+                    return ret
+                if attempt >= self.retry_policy.max_retries or \
+                        not self.retry_policy.is_retryable(method,
+                                                           ret.status_code):
+                    raise ConnectionError(
+                        'Status code {} for url {}\n{}'.format(
+                            ret.status_code, url, ret.text))
+                delay = self.retry_policy.get_delay(attempt, ret)
+                if ret.status_code == 429 and self.rate_limiter is not None:
+                    # Throttled : the other requests sharing the limiter
+                    # wait too, the next acquire() waits for this one
+                    self.rate_limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
+        finally:
+            latency = time.perf_counter() - start_time
+            for hook in self.hooks:
+                hook.after_request(
+                    method=method, endpoint=endpoint,
+                    status_code=None if ret is None else ret.status_code,
+                    latency=latency,
+                    content_length=0 if ret is None else len(ret.content),
+                    retries=attempt)
+
+
+class RequestHook:
+    """ Base class of the Client hooks, called around each request
+    (retries included). Override the methods you need.
+    endpoint is the URL template, ex : /quote/{pair} """
+    def before_request(self, method, endpoint):
+        pass
+
+    def after_request(self, method, endpoint, status_code, latency,
+                      content_length, retries):
+        """ status_code is None if no response was received,
+        latency is in seconds (backoff delays included) """
+        pass
+
+
+def _get_endpoint_template(url):
+    """ Get the endpoint of a URL, without the variable parts
+    >>> _get_endpoint_template("/quote/EURBTC?amount=100&side=SELL")
+    '/quote/{pair}'
+    >>> _get_endpoint_template("https://api.revolut.com/user/current/wallet")
+    '/user/current/wallet'
+    """
+    path = urlparse(url).path
+    if path.startswith(_URL_QUOTE):
+        return _URL_QUOTE + "{pair}"
+    if path.startswith(_URL_BIOMETRIC_CONFIRM):
+        return _URL_BIOMETRIC_CONFIRM + "{id}"
+    return path
+
+
+class _WalletSnapshot:
+    """ Last raw wallet downloaded, shared by the wallet accessors of
+    Revolut and revolut.aio.AsyncRevolut
+
+    >>> snapshot = _WalletSnapshot()
+    >>> snapshot.set({"id": "wallet_id"})
+    >>> snapshot.get(ttl=60), snapshot.get(ttl=0)
+    ({'id': 'wallet_id'}, None)
+    """
+    def __init__(self):
+        self.invalidate()
+
+    def get(self, ttl):
+        """ Get the raw wallet, None if there is none or if it is older
+        than ttl seconds """
+        if self._raw_wallet is None or \
+                time.monotonic() - self._time >= ttl:
+            return None
+        return self._raw_wallet
+
+    def set(self, raw_wallet):
+        self._raw_wallet = raw_wallet
+        self._time = time.monotonic()
+
+    def invalidate(self):
+        self._raw_wallet = None
+        self._time = None
 
 
 class Revolut:
-    def __init__(self, token, device_id):
-        self.client = Client(token=token, device_id=device_id)
+    def __init__(self, token, device_id, quote_cache=None,
+                 json_backend=None, retry_policy=None, rate_limiter=None,
+                 wallet_ttl=_DEFAULT_WALLET_TTL, api_base=API_BASE,
+                 hooks=None):
+        self.client = Client(token=token, device_id=device_id,
+                             json_backend=json_backend,
+                             retry_policy=retry_policy,
+                             rate_limiter=rate_limiter,
+                             api_base=api_base,
+                             hooks=hooks)
+        self.quote_cache = quote_cache
+        self.wallet_ttl = wallet_ttl
+        self._wallet_snapshot = _WalletSnapshot()
+
+    def get_wallet(self, refresh=False):
+        """ Get the raw wallet (/user/current/wallet), shared by all the
+        wallet accessors and cached for wallet_ttl seconds.
+        Set refresh to True to download it again """
+        raw_wallet = None if refresh else \
+            self._wallet_snapshot.get(self.wallet_ttl)
+        if raw_wallet is None:
+            ret = self.client._get(_URL_GET_ACCOUNTS)
+            raw_wallet = self.client._decode(ret)
+            self._wallet_snapshot.set(raw_wallet)
+        return raw_wallet
+
+    def invalidate_wallet(self):
+        """ Forget the cached wallet (ex : after an exchange) """
+        self._wallet_snapshot.invalidate()
 
     def get_account_balances(self):
         """ Get the account balance for each currency
         and returns it as a dict {"balance":XXXX, "currency":XXXX} """
-        ret = self.client._get(_URL_GET_ACCOUNTS)
-        raw_accounts = ret.json()
-
-        account_balances = []
-        for raw_account in raw_accounts.get("pockets"):
-            account_balances.append({
-                "balance": raw_account.get("balance"),
-                "currency": raw_account.get("currency"),
-                "type": raw_account.get("type"),
-                "state": raw_account.get("state"),
-                # name is present when the account is a vault (type = SAVINGS)
-                "vault_name": raw_account.get("name", ""),
-            })
-        self.account_balances = Accounts(account_balances)
+        raw_accounts = self.get_wallet()
+        self.account_balances = _build_accounts(raw_accounts)
         return self.account_balances
 
-    def get_account_transactions(self, from_date=None, to_date=None):
-        """Get the account transactions."""
+    def get_account_transactions(self, from_date=None, to_date=None,
+                                 max_workers=1,
+                                 window=_DEFAULT_TRANSACTIONS_WINDOW):
+        """Get the account transactions.
+        With max_workers > 1 and a from_date, [from_date, to_date] is split
+        in time windows, paged in parallel by max_workers threads """
+        if max_workers > 1 and from_date:
+            return self._get_account_transactions_by_windows(
+                from_date=from_date, to_date=to_date or datetime.now(),
+                max_workers=max_workers, window=window)
+        return AccountTransactions.from_pages(self.iter_account_transactions(
+            from_date=from_date, to_date=to_date, pages=True))
+
+    def _get_account_transactions_by_windows(self, from_date, to_date,
+                                             max_workers, window):
+        windows = []  # The most recent first, like the API
+        window_end = to_date
+        while window_end > from_date:
+            window_start = max(from_date, window_end - window)
+            windows.append((window_start, window_end))
+            window_end = window_start
+
+        def get_window_transactions(window_dates):
+            raw_transactions = []
+            for page in self._iter_raw_transactions_pages(*window_dates):
+                raw_transactions.extend(page)
+            return raw_transactions
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            windows_transactions = list(executor.map(
+                get_window_transactions, windows))
+
+        # The transactions on the windows limits may be returned twice
+        transaction_ids = set()
         raw_transactions = []
-        params = {}
-        if to_date:
-            params['to'] = int(to_date.timestamp()) * 1000
-        if from_date:
-            params['from'] = int(from_date.timestamp()) * 1000
+        for window_transactions in windows_transactions:
+            for transaction in window_transactions:
+                if transaction["id"] not in transaction_ids:
+                    transaction_ids.add(transaction["id"])
+                    raw_transactions.append(transaction)
+        return AccountTransactions(raw_transactions)
+
+    def iter_account_transactions(self, from_date=None, to_date=None,
+                                  pages=False, raw=False):
+        """ Yield the account transactions (AccountTransaction objects),
+        the most recent first, as each page is downloaded.
+        If pages is set, yield one AccountTransactions object per page.
+        If raw is set, yield the raw transactions (dict objects) instead,
+        or the lists of raw transactions of each page """
+        for raw_page in self._iter_raw_transactions_pages(from_date, to_date):
+            page = raw_page if raw else AccountTransactions(raw_page)
+            if pages:
+                yield page
+            elif raw:
+                yield from raw_page
+            else:
+                yield from page.list
+
+    def _iter_raw_transactions_pages(self, from_date=None, to_date=None):
+        """ Yield the raw transactions pages, the most recent first """
+        params = _build_transactions_params(from_date, to_date)
 
         while True:
             ret = self.client._get(_URL_GET_TRANSACTIONS_LAST, params=params)
-            ret_transactions = ret.json()
+            ret_transactions = self.client._decode(ret)
             if not ret_transactions:
                 break
             params['to'] = ret_transactions[-1]['startedDate']
-            raw_transactions.extend(ret_transactions)
-        
-        return AccountTransactions(raw_transactions)
+            yield ret_transactions
 
     def get_wallet_id(self):
         """ Get the main wallet_id """
-        ret = self.client._get(_URL_GET_ACCOUNTS)
-        raw = ret.json()
+        raw = self.get_wallet()
         return raw.get('id')
 
-    def quote(self, from_amount, to_currency):
-        if type(from_amount) != Amount:
-            raise TypeError("from_amount must be with the Amount type")
-
-        if to_currency not in _AVAILABLE_CURRENCIES:
-            raise KeyError(to_currency)
+    def quote(self, from_amount, to_currency, use_cache=True):
+        """ Get the quote of an amount in another currency.
+        Set use_cache to False to bypass the quote cache and get
+        a fresh rate (ex : before an exchange) """
+        url_quote = _build_quote_url(from_amount, to_currency)
+        use_cache = use_cache and self.quote_cache is not None
+        if use_cache:
+            quote_obj = self.quote_cache.get(from_amount, to_currency)
+            if quote_obj is not None:
+                return quote_obj
 
-        url_quote = urljoin(_URL_QUOTE, '{}{}?amount={}&side=SELL'.format(
-            from_amount.currency,
-            to_currency,
-            from_amount.revolut_amount))
         ret = self.client._get(url_quote)
-        raw_quote = ret.json()
+        raw_quote = self.client._decode(ret)
         quote_obj = Amount(revolut_amount=raw_quote["to"]["amount"],
                            currency=to_currency)
+        if use_cache:
+            self.quote_cache.set(from_amount, to_currency, quote_obj)
         return quote_obj
 
-    def exchange(self, from_amount, to_currency, simulate=False):
-        if type(from_amount) != Amount:
-            raise TypeError("from_amount must be with the Amount type")
-
-        if to_currency not in _AVAILABLE_CURRENCIES:
-            raise KeyError(to_currency)
+    def quote_many(self, pairs, max_concurrency=_DEFAULT_MAX_CONCURRENCY):
+        """ Get several quotes in parallel, over the shared session
+        pairs is an iterable of (from_amount, to_currency) tuples, equal
+        amounts (same currency and Revolut amount) being quoted once.
+        Returns a dict {pair: Amount}. When a quote fails, its pair is
+        mapped to the raised exception instead of an Amount """
+        pairs = list(dict.fromkeys(pairs))  # Remove duplicates, keep order
+        self.client._ensure_pool_size(max_concurrency)
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = [(pair, executor.submit(self.quote, *pair))
+                       for pair in pairs]
+
+        quotes = {}
+        for pair, future in futures:
+            error = future.exception()
+            quotes[pair] = future.result() if error is None else error
+        return quotes
 
-        data = {
-            "fromCcy": from_amount.currency,
-            "fromAmount": from_amount.revolut_amount,
-            "toCcy": to_currency,
-            "toAmount": None,
-        }
+    def exchange(self, from_amount, to_currency, simulate=False):
+        data = _build_exchange_data(from_amount, to_currency)
 
         if simulate:
             # Because we don't want to exchange currencies
             # for every test ;)
-            simu = '[{"account":{"id":"FAKE_ID"},\
-            "amount":-1,"balance":0,"completedDate":123456789,\
-            "counterpart":{"account":\
-            {"id":"FAKE_ID"},\
-            "amount":170,"currency":"BTC"},"currency":"EUR",\
-            "description":"Exchanged to BTC","direction":"sell",\
-            "fee":0,"id":"FAKE_ID",\
-            "legId":"FAKE_ID","rate":0.0001751234,\
-            "startedDate":123456789,"state":"COMPLETED","type":"EXCHANGE",\
-            "updatedDate":123456789},\
-            {"account":{"id":"FAKE_ID"},"amount":170,\
-            "balance":12345,"completedDate":12345678,"counterpart":\
-            {"account":{"id":"FAKE_ID"},\
-            "amount":-1,"currency":"EUR"},"currency":"BTC",\
-            "description":"Exchanged from EUR","direction":"buy","fee":0,\
-            "id":"FAKE_ID",\
-            "legId":"FAKE_ID",\
-            "rate":5700.0012345,"startedDate":123456789,\
-            "state":"COMPLETED","type":"EXCHANGE",\
-            "updatedDate":123456789}]'
-            raw_exchange = json.loads(simu)
+            raw_exchange = self.client.json_backend.loads(_SIMU_EXCHANGE)
         else:
+            # The balances will change
+            self.invalidate_wallet()
             ret = self.client._post(_URL_EXCHANGE, json=data)
-            raw_exchange = ret.json()
-
-        if raw_exchange[0]["state"] == "COMPLETED":
-            amount = raw_exchange[0]["counterpart"]["amount"]
-            currency = raw_exchange[0]["counterpart"]["currency"]
-            exchanged_amount = Amount(revolut_amount=amount,
-                                      currency=currency)
-            exchange_transaction = Transaction(from_amount=from_amount,
-                                               to_amount=exchanged_amount,
-                                               date=datetime.now())
-        else:
-            raise ConnectionError("Transaction error : %s" % ret.text)
+            raw_exchange = self.client._decode(ret)
+
+        return _build_exchange_transaction(raw_exchange, from_amount)
+
+
+_SIMU_EXCHANGE = '[{"account":{"id":"FAKE_ID"},\
+"amount":-1,"balance":0,"completedDate":123456789,\
+"counterpart":{"account":\
+{"id":"FAKE_ID"},\
+"amount":170,"currency":"BTC"},"currency":"EUR",\
+"description":"Exchanged to BTC","direction":"sell",\
+"fee":0,"id":"FAKE_ID",\
+"legId":"FAKE_ID","rate":0.0001751234,\
+"startedDate":123456789,"state":"COMPLETED","type":"EXCHANGE",\
+"updatedDate":123456789},\
+{"account":{"id":"FAKE_ID"},"amount":170,\
+"balance":12345,"completedDate":12345678,"counterpart":\
+{"account":{"id":"FAKE_ID"},\
+"amount":-1,"currency":"EUR"},"currency":"BTC",\
+"description":"Exchanged from EUR","direction":"buy","fee":0,\
+"id":"FAKE_ID",\
+"legId":"FAKE_ID",\
+"rate":5700.0012345,"startedDate":123456789,\
+"state":"COMPLETED","type":"EXCHANGE",\
+"updatedDate":123456789}]'
+
+
+def _build_accounts(raw_wallet):
+    """ Build the Accounts object from a raw /user/current/wallet response """
+    account_balances = []
+    for raw_account in raw_wallet.get("pockets"):
+        account_balances.append({
+            "balance": raw_account.get("balance"),
+            "currency": raw_account.get("currency"),
+            "type": raw_account.get("type"),
+            "state": raw_account.get("state"),
+            # name is present when the account is a vault (type = SAVINGS)
+            "vault_name": raw_account.get("name", ""),
+        })
+    return Accounts(account_balances)
+
+
+def _build_transactions_params(from_date=None, to_date=None):
+    """ Build the query parameters for the first transactions page
+    >>> _build_transactions_params()
+    {}
+    >>> _build_transactions_params(to_date=datetime.fromtimestamp(1))
+    {'to': 1000}
+    """
+    params = {}
+    if to_date:
+        params['to'] = int(to_date.timestamp()) * 1000
+    if from_date:
+        params['from'] = int(from_date.timestamp()) * 1000
+    return params
+
+
+def _build_quote_url(from_amount, to_currency):
+    """ Check the quote arguments and build the quote url
+    >>> _build_quote_url(Amount(real_amount=1, currency="EUR"), "BTC")
+    '/quote/EURBTC?amount=100&side=SELL'
+    """
+    if type(from_amount) != Amount:
+        raise TypeError("from_amount must be with the Amount type")
+
+    if to_currency not in _AVAILABLE_CURRENCIES:
+        raise KeyError(to_currency)
+
+    return urljoin(_URL_QUOTE, '{}{}?amount={}&side=SELL'.format(
+        from_amount.currency,
+        to_currency,
+        from_amount.revolut_amount))
+
+
+def _build_exchange_data(from_amount, to_currency):
+    """ Check the exchange arguments and build the request payload """
+    if type(from_amount) != Amount:
+        raise TypeError("from_amount must be with the Amount type")
+
+    if to_currency not in _AVAILABLE_CURRENCIES:
+        raise KeyError(to_currency)
+
+    return {
+        "fromCcy": from_amount.currency,
+        "fromAmount": from_amount.revolut_amount,
+        "toCcy": to_currency,
+        "toAmount": None,
+    }
+
+
+def _build_exchange_transaction(raw_exchange, from_amount):
+    """ Build the Transaction object from a raw /exchange response """
+    if raw_exchange[0]["state"] == "COMPLETED":
+        amount = raw_exchange[0]["counterpart"]["amount"]
+        currency = raw_exchange[0]["counterpart"]["currency"]
+        exchanged_amount = Amount(revolut_amount=amount,
+                                  currency=currency)
+        exchange_transaction = Transaction(from_amount=from_amount,
+                                           to_amount=exchanged_amount,
+                                           date=datetime.now())
+    else:
+        raise ConnectionError("Transaction error : %s" % raw_exchange)
 
-        return exchange_transaction
+    return exchange_transaction
 
 
 class Account:
     """ Class to handle an account """
+    __slots__ = ("account_type", "balance", "state", "vault_name")
+
     def __init__(self, account_type, balance, state, vault_name):
         self.account_type = account_type  # CURRENT, SAVINGS
         self.balance = balance
         self.state = state  # ACTIVE, INACTIVE
         self.vault_name = vault_name
-        self.name = self.build_account_name()
+
+    @property
+    def name(self):
+        return self.build_account_name()
 
     def build_account_name(self):
         if self.account_type == _VAULT_ACCOUNT_TYPE:
@@ -340,29 +919,153 @@ class Accounts:
         return self.list[key]
 
     def csv(self, lang="fr"):
+        csv_io = io.StringIO()
+        self.write_csv(csv_io, lang=lang)
+        return csv_io.getvalue()[:-1]  # Without the last line break
+
+    def write_csv(self, fileobj, lang="fr"):
+        """ Write the ACTIVE accounts as csv to fileobj, row by row """
         lang_is_fr = lang == "fr"
         if lang_is_fr:
-            csv_str = "Nom du compte;Solde;Devise"
+            header = "Nom du compte;Solde;Devise"
         else:
-            csv_str = "Account name,Balance,Currency"
+            header = "Account name,Balance,Currency"
 
         # Europe uses 'comma' as decimal separator,
         # so it can't be used as delimiter:
         delimiter = ";" if lang_is_fr else ","
 
+        fileobj.write(header + "\n")
         for account in self.list:
             if account.state == _ACTIVE_ACCOUNT:  # Do not print INACTIVE
-                csv_str += "\n" + delimiter.join((
+                balance_str = account.balance.real_amount_str
+                if lang_is_fr:
+                    balance_str = balance_str.replace(".", ",")
+                fileobj.write(delimiter.join((
                     account.name,
-                    account.balance.real_amount_str,
+                    balance_str,
                     account.balance.currency,
-                ))
+                )) + "\n")
+
+    def total_value(self, base_currency, revolut,
+                    max_concurrency=_DEFAULT_MAX_CONCURRENCY):
+        """ Get the value of the ACTIVE accounts in base_currency,
+        as a Valuation object. Each currency is quoted once (in parallel,
+        bypassing the quote cache) for the sum of the absolute balances of
+        its accounts, and this rate is applied to each account in that
+        currency : accounts offsetting each other keep their value """
+        balances = OrderedDict()  # currency => sum of the revolut amounts
+        gross_balances = {}  # currency => sum of their absolute values
+        active_accounts = [account for account in self.list
+                           if account.state == _ACTIVE_ACCOUNT]
+        for account in active_accounts:
+            currency = account.balance.currency
+            amount = account.balance.revolut_amount
+            balances[currency] = balances.get(currency, 0) + amount
+            gross_balances[currency] = gross_balances.get(currency, 0) + \
+                abs(amount)
+
+        def get_quote(currency):
+            quote = revolut.quote(
+                from_amount=Amount(revolut_amount=gross_balances[currency],
+                                   currency=currency),
+                to_currency=base_currency, use_cache=False)
+            return quote, datetime.now()
+
+        # Nothing to quote for the base currency, nor for empty accounts
+        quoted_currencies = [currency for currency in balances
+                             if currency != base_currency and
+                             gross_balances[currency]]
+        quotes = {}
+        if quoted_currencies:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                quotes = dict(zip(quoted_currencies, executor.map(
+                    get_quote, quoted_currencies)))
+
+        accounts = []
+        values = {currency: 0 for currency in balances}
+        for account in active_accounts:
+            currency = account.balance.currency
+            amount = account.balance.revolut_amount
+            if currency in quotes:
+                value = int(round(quotes[currency][0].revolut_amount *
+                                  amount / gross_balances[currency]))
+            elif currency == base_currency:
+                value = amount
+            else:
+                value = 0
+            values[currency] += value
+            accounts.append((account, Amount(revolut_amount=value,
+                                             currency=base_currency)))
+
+        currencies = OrderedDict()
+        for currency, balance in balances.items():
+            quote, quote_date = quotes.get(currency, (None, None))
+            if quote is not None:
+                rate = quote.real_amount / Amount(
+                    revolut_amount=gross_balances[currency],
+                    currency=currency).real_amount
+            elif currency == base_currency:
+                rate = 1.0
+            else:
+                rate = None
+            currencies[currency] = CurrencyValuation(
+                balance=Amount(revolut_amount=balance, currency=currency),
+                value=Amount(revolut_amount=values[currency],
+                             currency=base_currency),
+                rate=rate, quote_date=quote_date)
+
+        total = Amount(revolut_amount=sum(values.values()),
+                       currency=base_currency)
+        return Valuation(total=total, currencies=currencies,
+                         accounts=accounts)
+
+
+class CurrencyValuation:
+    """ Value of the balance of a currency (sum of its accounts) in the base
+    currency. rate is the value of 1 unit of the currency in the base
+    currency (None if it was not quoted), and quote_date the date of the
+    quote used (None if no quote was needed) """
+    __slots__ = ("balance", "value", "rate", "quote_date")
+
+    def __init__(self, balance, value, rate, quote_date):
+        self.balance = balance
+        self.value = value
+        self.rate = rate
+        self.quote_date = quote_date
+
+    def __str__(self):
+        if self.quote_date is None:
+            return "{} => {}".format(self.balance, self.value)
+        return "{} => {} (quote of {:%d/%m/%Y %H:%M:%S})".format(
+            self.balance, self.value, self.quote_date)
 
-        return csv_str.replace(".", ",") if lang_is_fr else csv_str
+
+class Valuation:
+    """ Value of accounts in a base currency (see Accounts.total_value) :
+    the total, the CurrencyValuation of each currency,
+    and the list of (Account, value) """
+    __slots__ = ("total", "currencies", "accounts")
+
+    def __init__(self, total, currencies, accounts):
+        self.total = total
+        self.currencies = currencies
+        self.accounts = accounts
+
+    def __str__(self):
+        lines = [str(currency_valuation)
+                 for currency_valuation in self.currencies.values()]
+        lines.append("Total : {}".format(self.total))
+        return "\n".join(lines)
 
 
 class AccountTransaction:
     """ Class to handle an account transaction """
+    __slots__ = ("transactions_type", "state", "started_date",
+                 "completed_date", "amount", "fee", "description",
+                 "account_id")
+
     def __init__(
             self,
             transactions_type,
@@ -414,71 +1117,286 @@ class AccountTransaction:
 
 
 class AccountTransactions:
-    """ Class to handle the account transactions """
+    """ Class to handle the account transactions
+
+    The transactions can be queried with chainable filters, using indexes
+    built at the first query (see where and between) :
+    transactions.where(state="COMPLETED", currency=["EUR", "USD"])
+    .between(from_date, to_date) """
 
     def __init__(self, account_transactions):
-        self.raw_list = account_transactions
-        self.list = [
-            AccountTransaction(
-                transactions_type=transaction.get("type"),
-                state=transaction.get("state"),
-                started_date=transaction.get("startedDate"),
-                completed_date=transaction.get("completedDate"),
-                amount=Amount(revolut_amount=transaction.get('amount'),
-                              currency=transaction.get('currency')),
-                fee=transaction.get('fee'),
-                description=transaction.get('description'),
-                account_id=transaction.get('account').get('id')
-            )
-            for transaction in self.raw_list
-        ]
+        self.raw_list = list(account_transactions)
+        self.list = [_build_account_transaction(transaction)
+                     for transaction in self.raw_list]
+        self._indexes = {}
+
+    @classmethod
+    def from_pages(cls, pages):
+        """ Build the object from an iterable of AccountTransactions pages
+        (ex : Revolut.iter_account_transactions(pages=True)),
+        without decoding the transactions again """
+        account_transactions = cls([])
+        for page in pages:
+            account_transactions.raw_list.extend(page.raw_list)
+            account_transactions.list.extend(page.list)
+        return account_transactions
+
+    def get_index(self, field):
+        """ Get the hash index of a field (state, transactions_type,
+        currency or account_id) : a dict {value: [positions in self.list]} """
+        index = self._indexes.get(field)
+        if index is None:
+            get_value = _INDEXED_FIELDS[field]
+            index = {}
+            for position, transaction in enumerate(self.list):
+                index.setdefault(get_value(transaction), []).append(position)
+            self._indexes[field] = index
+        return index
+
+    def get_sorted_index(self, column="started_date"):
+        """ Get the index of a date column (started_date or completed_date) :
+        (sorted timestamps, their positions in self.list).
+        The transactions without date (pending ones) are not indexed """
+        if column not in ("started_date", "completed_date"):
+            raise KeyError(column)
+        index = self._indexes.get(column)
+        if index is None:
+            dated = sorted((getattr(transaction, column), position)
+                           for position, transaction in enumerate(self.list)
+                           if getattr(transaction, column) is not None)
+            index = ([date for date, _ in dated],
+                     [position for _, position in dated])
+            self._indexes[column] = index
+        return index
+
+    def query(self):
+        """ Get a TransactionQuery on all the transactions """
+        return TransactionQuery(self)
+
+    def where(self, **criteria):
+        """ See TransactionQuery.where """
+        return self.query().where(**criteria)
+
+    def between(self, from_date=None, to_date=None, column="started_date"):
+        """ See TransactionQuery.between """
+        return self.query().between(from_date, to_date, column=column)
+
+    def group_by(self, field):
+        """ See TransactionQuery.group_by """
+        return self.query().group_by(field)
 
     def __len__(self):
         return len(self.list)
 
+    def __iter__(self):
+        return iter(self.list)
+
+    def __getitem__(self, key):
+        """ Method to access the object as a list
+        (ex : account_transactions[1]) """
+        return self.list[key]
+
+    def to_columns(self):
+        """ Get the transactions as a TransactionTable (NumPy columns),
+        for vectorized filters and sums """
+        # NumPy is an optional dependency
+        from revolut.table import TransactionTable
+        return TransactionTable.from_raw(self.raw_list)
+
     def csv(self, lang="fr", reverse=False):
-        lang_is_fr = lang == "fr"
-        if lang_is_fr:
-            csv_str = "Date-heure (DD/MM/YYYY HH:MM:ss);Description;Montant;Devise"
-            date_format = "%d/%m/%Y %H:%M:%S"
-        else:
-            csv_str = "Date-time (MM/DD/YYYY HH:MM:ss),Description,Amount,Currency"
-            date_format = "%m/%d/%Y %H:%M:%S"
+        csv_io = io.StringIO()
+        self.write_csv(csv_io, lang=lang, reverse=reverse)
+        return csv_io.getvalue()[:-1]  # Without the last line break
+
+    def write_csv(self, fileobj, lang="fr", reverse=False):
+        """ Write the transactions as csv to fileobj, row by row """
+        transaction_list = reversed(self.list) if reverse else self.list
+        write_transactions_csv(fileobj, transaction_list, lang=lang)
+
+
+class TransactionQuery:
+    """ Selection of AccountTransactions, with chainable filters
+
+    >>> transactions = AccountTransactions([
+    ...     {"id": "a", "state": "COMPLETED", "startedDate": 3000,
+    ...      "amount": -100, "currency": "EUR", "account": {"id": "1"}},
+    ...     {"id": "b", "state": "DECLINED", "startedDate": 2000,
+    ...      "amount": -200, "currency": "EUR", "account": {"id": "1"}},
+    ...     {"id": "c", "state": "COMPLETED", "startedDate": 1000,
+    ...      "amount": 300, "currency": "USD", "account": {"id": "2"}}])
+    >>> query = transactions.where(state="COMPLETED").between(1000, 3000)
+    >>> [str(transaction.amount) for transaction in query]
+    ['3.00 USD']
+    >>> len(transactions.where(currency=["EUR", "USD"], account_id="1"))
+    2
+    """
+    def __init__(self, account_transactions, positions=None):
+        self.account_transactions = account_transactions
+        # Sorted positions in account_transactions.list (None : all)
+        self.positions = positions
+
+    def _get_positions(self):
+        if self.positions is None:
+            return range(len(self.account_transactions))
+        return self.positions
 
-        # Europe uses 'comma' as decimal separator,
-        # so it can't be used as delimiter:
-        delimiter = ";" if lang_is_fr else ","
+    def __len__(self):
+        return len(self._get_positions())
+
+    def __iter__(self):
+        transaction_list = self.account_transactions.list
+        return (transaction_list[position]
+                for position in self._get_positions())
+
+    def _filter(self, positions):
+        """ Get a new query, keeping only the positions given too """
+        if self.positions is not None:
+            kept = set(self.positions)
+            positions = [position for position in positions
+                         if position in kept]
+        return TransactionQuery(self.account_transactions, sorted(positions))
+
+    def where(self, **criteria):
+        """ Keep the transactions matching every criterion, ex :
+        where(state="COMPLETED", currency=["EUR", "USD"]).
+        The fields are state, transactions_type, currency and account_id """
+        query = self
+        for field, values in criteria.items():
+            if isinstance(values, str) or values is None:
+                values = [values]
+            index = self.account_transactions.get_index(field)
+            positions = []
+            for value in set(values):
+                positions.extend(index.get(value, []))
+            query = query._filter(positions)
+        return query
+
+    def between(self, from_date=None, to_date=None, column="started_date"):
+        """ Keep the transactions with from_date <= date < to_date
+        (datetime objects or timestamps in ms) """
+        dates, positions = self.account_transactions.get_sorted_index(column)
+        start = 0 if from_date is None else \
+            bisect.bisect_left(dates, _to_timestamp(from_date))
+        end = len(dates) if to_date is None else \
+            bisect.bisect_left(dates, _to_timestamp(to_date))
+        return self._filter(positions[start:end])
+
+    def group_by(self, field):
+        """ Split the transactions by value of a field (ex : account_id),
+        returns a dict {value: TransactionQuery} """
+        groups = {}
+        for value in self.account_transactions.get_index(field):
+            group = self.where(**{field: value})
+            if len(group):
+                groups[value] = group
+        return groups
+
+    def to_account_transactions(self):
+        """ Get the selected transactions as a new AccountTransactions """
+        account_transactions = AccountTransactions([])
+        for position in self._get_positions():
+            account_transactions.raw_list.append(
+                self.account_transactions.raw_list[position])
+            account_transactions.list.append(
+                self.account_transactions.list[position])
+        return account_transactions
+
+
+def _to_timestamp(date):
+    """ Convert a datetime (or a timestamp in ms) to a timestamp in ms
+    >>> _to_timestamp(datetime.fromtimestamp(1))
+    1000
+    """
+    if isinstance(date, datetime):
+        return int(date.timestamp()) * 1000
+    return int(date)
+
+
+def write_transactions_csv(fileobj, account_transactions, lang="fr"):
+    """ Write AccountTransaction objects as csv to fileobj, row by row.
+    account_transactions may be any iterable,
+    ex : Revolut.iter_account_transactions() """
+    lang_is_fr = lang == "fr"
+    if lang_is_fr:
+        header = "Date-heure (DD/MM/YYYY HH:MM:ss);Description;Montant;Devise"
+        date_format = "%d/%m/%Y %H:%M:%S"
+    else:
+        header = "Date-time (MM/DD/YYYY HH:MM:ss),Description,Amount,Currency"
+        date_format = "%m/%d/%Y %H:%M:%S"
 
+    # Europe uses 'comma' as decimal separator,
+    # so it can't be used as delimiter:
+    delimiter = ";" if lang_is_fr else ","
+
+    fileobj.write(header + "\n")
+    for account_transaction in account_transactions:
         # Do not export declined or failed payments
-        transaction_list = list(reversed(self.list)) if reverse else self.list
-        for account_transaction in transaction_list:
-            if account_transaction.state not in [
-                    _TRANSACTION_DECLINED,
-                    _TRANSACTION_FAILED,
-                    _TRANSACTION_REVERTED
-                ]:
-
-                csv_str += "\n" + delimiter.join((
-                    account_transaction.get_datetime__str(date_format),
-                    account_transaction.get_description(),
-                    account_transaction.get_amount__str(),
-                    account_transaction.amount.currency
-                ))
-        return csv_str.replace(".", ",") if lang_is_fr else csv_str
-
-
-def get_token_step1(device_id, phone, password, simulate=False):
+        if account_transaction.state in _CSV_EXCLUDED_STATES:
+            continue
+
+        amount_str = account_transaction.get_amount__str()
+        if lang_is_fr:
+            amount_str = amount_str.replace(".", ",")
+        fileobj.write(delimiter.join((
+            account_transaction.get_datetime__str(date_format),
+            account_transaction.get_description(),
+            amount_str,
+            account_transaction.amount.currency
+        )) + "\n")
+
+
+def write_transactions_ndjson(fileobj, raw_pages, json_backend=None):
+    """ Write raw transactions as NDJSON (one JSON object per line) to
+    fileobj. raw_pages is an iterable of lists of raw transactions,
+    ex : Revolut.iter_account_transactions(pages=True, raw=True).
+    fileobj is flushed after each page, so that the lines can be read
+    before the end of the download
+
+    >>> output = io.StringIO()
+    >>> write_transactions_ndjson(output, [[{"id": "a"}], [{"id": "b"}]],
+    ...                           json_backend="json")
+    >>> print(output.getvalue(), end="")
+    {"id": "a"}
+    {"id": "b"}
+    """
+    if not isinstance(json_backend, JsonBackend):
+        json_backend = JsonBackend(json_backend)
+    for raw_page in raw_pages:
+        fileobj.write("".join(json_backend.dumps(raw_transaction) + "\n"
+                              for raw_transaction in raw_page))
+        fileobj.flush()
+
+
+def _build_account_transaction(transaction):
+    """ Build an AccountTransaction object from a raw transaction """
+    return AccountTransaction(
+        transactions_type=transaction.get("type"),
+        state=transaction.get("state"),
+        started_date=transaction.get("startedDate"),
+        completed_date=transaction.get("completedDate"),
+        amount=Amount(revolut_amount=transaction.get('amount'),
+                      currency=transaction.get('currency')),
+        fee=transaction.get('fee'),
+        description=transaction.get('description'),
+        account_id=transaction.get('account').get('id')
+    )
+
+
+def get_token_step1(device_id, phone, password, simulate=False,
+                    api_base=API_BASE):
     """ Function to obtain a Revolut token (step 1 : send a code by sms/email) """
     if simulate:
         return "SMS"
-    c = Client(device_id=device_id, token=_DEFAULT_TOKEN_FOR_SIGNIN)
+    c = Client(device_id=device_id, token=_DEFAULT_TOKEN_FOR_SIGNIN,
+               api_base=api_base)
     data = {"phone": phone, "password": password}
     ret = c._post(_URL_GET_TOKEN_STEP1, json=data)
-    channel = ret.json().get("channel")
+    channel = c._decode(ret).get("channel")
     return channel
 
 
-def get_token_step2(device_id, phone, code, simulate=False):
+def get_token_step2(device_id, phone, code, simulate=False,
+                    api_base=API_BASE):
     """ Function to obtain a Revolut token (step 2 : with code) """
     if simulate:
         # Because we don't want to receive a code through sms
@@ -496,13 +1414,15 @@ def get_token_step2(device_id, phone, code, simulate=False):
         "pockets":[{"id":"pocket_id","type":"CURRENT","state":"ACTIVE",\
         "currency":"EUR","balance":100,"blockedAmount":0,"closed":false,\
         "creditLimit":0}]},"accessToken":"myaccesstoken"}'
+        import json
         raw_get_token = json.loads(simu)
     else:
-        c = Client(device_id=device_id, token=_DEFAULT_TOKEN_FOR_SIGNIN)
+        c = Client(device_id=device_id, token=_DEFAULT_TOKEN_FOR_SIGNIN,
+                   api_base=api_base)
         code = code.replace("-", "")  # If the user would put -
         data = {"phone": phone, "code": code}
         ret = c._post(_URL_GET_TOKEN_STEP2, json=data)
-        raw_get_token = ret.json()
+        raw_get_token = c._decode(ret)
     return raw_get_token
 
 
@@ -511,15 +1431,18 @@ def extract_token(json_response):
     access_token = json_response["accessToken"]
     token_to_encode = "{}:{}".format(user_id, access_token).encode("ascii")
     # Ascii encoding required by b64encode function : 8 bits char as input
+    import base64
     token = base64.b64encode(token_to_encode)
     return token.decode("ascii")
 
 
-def signin_biometric(device_id, phone, access_token, selfie_filepath):
+def signin_biometric(device_id, phone, access_token, selfie_filepath,
+                     api_base=API_BASE):
     files = {"selfie": open(selfie_filepath, "rb")}
-    c = Client(device_id=device_id, token=_DEFAULT_TOKEN_FOR_SIGNIN)
+    c = Client(device_id=device_id, token=_DEFAULT_TOKEN_FOR_SIGNIN,
+               api_base=api_base)
     c.session.auth = (phone, access_token)
-    res = c._post(API_BASE + "/biometric-signin/selfie", files=files)
-    biometric_id = res.json()["id"]
-    res = c._post(API_BASE + "/biometric-signin/confirm/" + biometric_id)
-    return res.json()
+    res = c._post(_URL_BIOMETRIC_SELFIE, files=files)
+    biometric_id = c._decode(res)["id"]
+    res = c._post(_URL_BIOMETRIC_CONFIRM + biometric_id)
+    return c._decode(res)
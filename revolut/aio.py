@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio counterpart of the Revolut client
+
+This is not an asynchronous HTTP transport : the blocking calls of a
+revolut.Client (requests) are run on a pool of max_concurrency threads,
+sharing one connection pool. Any number of coroutines can await the
+requests, but at most max_concurrency requests are in flight at a time,
+each one holding a thread : hundreds of concurrent requests need hundreds
+of threads (100 by default).
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from revolut import (
+    API_BASE, Amount, AccountTransactions, Client,
+    _URL_GET_ACCOUNTS, _URL_GET_TRANSACTIONS_LAST, _URL_EXCHANGE,
+    _SIMU_EXCHANGE, _build_accounts, _build_transactions_params,
+    _build_quote_url, _build_exchange_data, _build_exchange_transaction,
+    _DEFAULT_WALLET_TTL, _WalletSnapshot,
+)
+
+# Threads (and pooled connections) of an AsyncClient : the maximum number
+# of requests in flight, higher than for the blocking client
+_DEFAULT_ASYNC_MAX_CONCURRENCY = 100
+
+
+# asyncio.get_running_loop is new in Python 3.7 (get_event_loop returns
+# the running loop, when called from a coroutine)
+_get_running_loop = getattr(asyncio, "get_running_loop",
+                            asyncio.get_event_loop)
+
+
+class AsyncClient:
+    """ Do the requests with the Revolut servers, from an asyncio loop,
+    on a pool of max_concurrency threads (the concurrency limit) """
+    def __init__(self, token, device_id,
+                 max_concurrency=_DEFAULT_ASYNC_MAX_CONCURRENCY,
+                 json_backend=None, retry_policy=None, rate_limiter=None,
+                 api_base=API_BASE,
+                 hooks=None):
+        self.client = Client(token=token, device_id=device_id,
+                             json_backend=json_backend,
+                             retry_policy=retry_policy,
+                             rate_limiter=rate_limiter,
+                             api_base=api_base,
+                             hooks=hooks)
+        # One connection pool, large enough for every worker
+        self.client._ensure_pool_size(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    @property
+    def session(self):
+        return self.client.session
+
+    @property
+    def json_backend(self):
+        return self.client.json_backend
+
+    def _decode(self, ret):
+        return self.client._decode(ret)
+
+    async def _get(self, url, **kwargs):
+        return await self._run(self.client._get, url, **kwargs)
+
+    async def _post(self, url, **kwargs):
+        return await self._run(self.client._post, url, **kwargs)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = _get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.client.session.close()
+
+
+class AsyncRevolut:
+    """ Same API as revolut.Revolut, with coroutines
+
+    >>> import asyncio
+    >>> rev = AsyncRevolut(token="token", device_id="device_id")
+    >>> loop = asyncio.new_event_loop()
+    >>> tr = loop.run_until_complete(rev.exchange(
+    ...     Amount(real_amount=0.01, currency="EUR"), "BTC", simulate=True))
+    >>> print(tr.to_amount)
+    0.00000170 BTC
+    >>> loop.close()
+    >>> rev.close()
+    """
+    def __init__(self, token, device_id,
+                 max_concurrency=_DEFAULT_ASYNC_MAX_CONCURRENCY,
+                 json_backend=None, retry_policy=None, rate_limiter=None,
+                 wallet_ttl=_DEFAULT_WALLET_TTL, api_base=API_BASE,
+                 hooks=None):
+        self.client = AsyncClient(token=token, device_id=device_id,
+                                  max_concurrency=max_concurrency,
+                                  json_backend=json_backend,
+                                  retry_policy=retry_policy,
+                                  rate_limiter=rate_limiter,
+                                  api_base=api_base,
+                                  hooks=hooks)
+        self.wallet_ttl = wallet_ttl
+        self._wallet_snapshot = _WalletSnapshot()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.client.close()
+
+    async def get_wallet(self, refresh=False):
+        """ Get the raw wallet, cached for wallet_ttl seconds
+        (see revolut.Revolut.get_wallet) """
+        raw_wallet = None if refresh else \
+            self._wallet_snapshot.get(self.wallet_ttl)
+        if raw_wallet is None:
+            ret = await self.client._get(_URL_GET_ACCOUNTS)
+            raw_wallet = self.client._decode(ret)
+            self._wallet_snapshot.set(raw_wallet)
+        return raw_wallet
+
+    def invalidate_wallet(self):
+        """ Forget the cached wallet (ex : after an exchange) """
+        self._wallet_snapshot.invalidate()
+
+    async def get_account_balances(self):
+        """ Get the account balance for each currency """
+        raw_accounts = await self.get_wallet()
+        self.account_balances = _build_accounts(raw_accounts)
+        return self.account_balances
+
+    async def get_account_transactions(self, from_date=None, to_date=None):
+        """ Get the account transactions """
+        raw_transactions = []
+        params = _build_transactions_params(from_date, to_date)
+
+        while True:
+            ret = await self.client._get(_URL_GET_TRANSACTIONS_LAST,
+                                         params=dict(params))
+            ret_transactions = self.client._decode(ret)
+            if not ret_transactions:
+                break
+            params['to'] = ret_transactions[-1]['startedDate']
+            raw_transactions.extend(ret_transactions)
+
+        return AccountTransactions(raw_transactions)
+
+    async def get_wallet_id(self):
+        """ Get the main wallet_id """
+        raw = await self.get_wallet()
+        return raw.get('id')
+
+    async def quote(self, from_amount, to_currency):
+        url_quote = _build_quote_url(from_amount, to_currency)
+        ret = await self.client._get(url_quote)
+        raw_quote = self.client._decode(ret)
+        return Amount(revolut_amount=raw_quote["to"]["amount"],
+                      currency=to_currency)
+
+    async def exchange(self, from_amount, to_currency, simulate=False):
+        data = _build_exchange_data(from_amount, to_currency)
+
+        if simulate:
+            raw_exchange = self.client.json_backend.loads(_SIMU_EXCHANGE)
+        else:
+            # The balances will change
+            self.invalidate_wallet()
+            ret = await self.client._post(_URL_EXCHANGE, json=data)
+            raw_exchange = self.client._decode(ret)
+
+        return _build_exchange_transaction(raw_exchange, from_amount)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+In-process metrics of the requests sent to the Revolut API,
+exported in the Prometheus text format
+
+>>> from revolut import Revolut
+>>> metrics = MetricsRegistry()
+>>> rev = Revolut(token="token", device_id="device_id", hooks=[metrics])
+"""
+
+import threading
+
+from revolut import RequestHook
+
+# Upper bounds of the latency histogram buckets (seconds)
+_DEFAULT_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels):
+    r""" Format the labels of a Prometheus sample
+    >>> _format_labels([("endpoint", '/a"b'), ("method", "GET")])
+    '{endpoint="/a\\"b",method="GET"}'
+    """
+    return "{" + ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels) + "}"
+
+
+class LatencyHistogram:
+    """ Cumulative histogram of the latencies of an endpoint """
+    def __init__(self, buckets=_DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry(RequestHook):
+    """ Counters and latency histograms per endpoint,
+    to be passed as a Client hook : Revolut(..., hooks=[MetricsRegistry()])
+    """
+    def __init__(self, latency_buckets=_DEFAULT_LATENCY_BUCKETS):
+        self.latency_buckets = latency_buckets
+        # (endpoint, method, status_code) => number of requests
+        self.requests = {}
+        # (endpoint, method) => value
+        self.retries = {}
+        self.response_bytes = {}
+        self.in_flight = {}
+        self.latencies = {}  # LatencyHistogram objects
+        self._lock = threading.Lock()
+
+    def before_request(self, method, endpoint):
+        key = (endpoint, method)
+        with self._lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def after_request(self, method, endpoint, status_code, latency,
+                      content_length, retries):
+        key = (endpoint, method)
+        status = "error" if status_code is None else str(status_code)
+        with self._lock:
+            self.in_flight[key] -= 1
+            request_key = (endpoint, method, status)
+            self.requests[request_key] = \
+                self.requests.get(request_key, 0) + 1
+            self.retries[key] = self.retries.get(key, 0) + retries
+            self.response_bytes[key] = \
+                self.response_bytes.get(key, 0) + content_length
+            if key not in self.latencies:
+                self.latencies[key] = LatencyHistogram(self.latency_buckets)
+            self.latencies[key].observe(latency)
+
+    def to_prometheus(self, prefix="revolut"):
+        """ Export the metrics in the Prometheus text format """
+        lines = []
+
+        def add_metric(name, metric_type, help_str, samples):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help_str))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, metric_type))
+            for sample_name, labels, value in samples:
+                lines.append("{}_{}{} {}".format(
+                    prefix, sample_name, _format_labels(labels), value))
+
+        with self._lock:
+            add_metric(
+                "requests_total", "counter",
+                "Number of requests sent to the Revolut API",
+                [("requests_total",
+                  [("endpoint", endpoint), ("method", method),
+                   ("status", status)], count)
+                 for (endpoint, method, status), count
+                 in sorted(self.requests.items())])
+            add_metric(
+                "request_retries_total", "counter",
+                "Number of retries of the requests",
+                [("request_retries_total",
+                  [("endpoint", endpoint), ("method", method)], count)
+                 for (endpoint, method), count
+                 in sorted(self.retries.items())])
+            add_metric(
+                "response_bytes_total", "counter",
+                "Size of the response bodies (bytes)",
+                [("response_bytes_total",
+                  [("endpoint", endpoint), ("method", method)], count)
+                 for (endpoint, method), count
+                 in sorted(self.response_bytes.items())])
+            add_metric(
+                "requests_in_flight", "gauge",
+                "Number of requests waiting for a response",
+                [("requests_in_flight",
+                  [("endpoint", endpoint), ("method", method)], count)
+                 for (endpoint, method), count
+                 in sorted(self.in_flight.items())])
+
+            histogram_samples = []
+            for (endpoint, method), histogram in \
+                    sorted(self.latencies.items()):
+                labels = [("endpoint", endpoint), ("method", method)]
+                for upper_bound, count in zip(histogram.buckets,
+                                              histogram.counts):
+                    histogram_samples.append((
+                        "request_duration_seconds_bucket",
+                        labels + [("le", upper_bound)], count))
+                histogram_samples.append((
+                    "request_duration_seconds_bucket",
+                    labels + [("le", "+Inf")], histogram.count))
+                histogram_samples.append((
+                    "request_duration_seconds_sum", labels, histogram.sum))
+                histogram_samples.append((
+                    "request_duration_seconds_count", labels,
+                    histogram.count))
+            add_metric(
+                "request_duration_seconds", "histogram",
+                "Latency of the requests, retries included (seconds)",
+                histogram_samples)
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP server mimicking the Revolut API endpoints used by this package,
+with synthetic data, for offline tests and load tests
+
+Usage : python -m revolut.mock_server --help
+Then : Revolut(token=..., device_id=..., api_base="http://127.0.0.1:8080")
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+import socketserver
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+import click
+
+from revolut import (
+    _URL_GET_ACCOUNTS, _URL_GET_TRANSACTIONS_LAST, _URL_QUOTE,
+    _URL_EXCHANGE, _URL_GET_TOKEN_STEP1, _URL_GET_TOKEN_STEP2,
+    _SCALE_FACTOR_CURRENCY_DICT, _DEFAULT_SCALE_FACTOR,
+)
+
+_DEFAULT_PAGE_SIZE = 50
+_DEFAULT_TRANSACTIONS_INTERVAL = 3600 * 1000  # 1 transaction per hour (ms)
+
+# Synthetic rates : value of 1 unit of the currency in EUR
+_MOCK_RATES_IN_EUR = {
+    "EUR": 1.0, "USD": 0.9, "GBP": 1.15, "CHF": 0.95, "JPY": 0.0065,
+    "SEK": 0.088, "AUD": 0.6, "CAD": 0.67, "PLN": 0.23, "BTC": 30000.0,
+    "ETH": 2000.0, "LTC": 80.0, "XRP": 0.5, "BCH": 250.0, "IDR": 0.0000575,
+}
+_MOCK_CURRENCIES = ["EUR", "USD", "GBP", "BTC", "CHF", "JPY", "SEK", "ETH"]
+_MOCK_TRANSACTION_TYPES = ["CARD_PAYMENT", "TRANSFER", "TOPUP", "EXCHANGE"]
+_MOCK_TRANSACTION_STATES = ["COMPLETED"] * 17 + ["PENDING", "DECLINED",
+                                                 "REVERTED"]
+
+
+def _get_scale(currency):
+    return _SCALE_FACTOR_CURRENCY_DICT.get(currency, _DEFAULT_SCALE_FACTOR)
+
+
+class MockRevolutServer:
+    """ Fake Revolut API, with a synthetic wallet and transactions history
+
+    The history has `transactions` transactions, one every `interval` ms,
+    up to the server start. They are generated on the fly from their index,
+    so the history can be of any size.
+    latency (seconds) is added to each response, error_rate is the
+    probability of a 500 response, and throttle_rate the probability of
+    a 429 response (with a Retry-After header of retry_after seconds)
+
+    >>> from revolut import Revolut
+    >>> with MockRevolutServer(transactions=120, page_size=50) as server:
+    ...     rev = Revolut(token="token", device_id="device_id",
+    ...                   api_base=server.api_base)
+    ...     len(rev.get_account_transactions())
+    120
+    """
+    def __init__(self, host="127.0.0.1", port=0, pockets=4,
+                 transactions=1000, page_size=_DEFAULT_PAGE_SIZE,
+                 interval=_DEFAULT_TRANSACTIONS_INTERVAL,
+                 latency=0, error_rate=0, throttle_rate=0, retry_after=0,
+                 seed=0):
+        self.transactions = transactions
+        self.page_size = page_size
+        self.interval = interval
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.end_date = int(time.time()) * 1000
+        self.wallet = self._build_wallet(pockets)
+
+        self.httpd = _ThreadingHTTPServer((host, port), _MockRequestHandler)
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def api_base(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        """ Serve the requests in a background thread """
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _build_wallet(self, pockets):
+        raw_pockets = []
+        for i in range(pockets):
+            currency = _MOCK_CURRENCIES[i % len(_MOCK_CURRENCIES)]
+            raw_pockets.append({
+                "id": "pocket_{}".format(i),
+                "type": "CURRENT",
+                "state": "ACTIVE",
+                "currency": currency,
+                "balance": self.random.randint(0, 1000000)
+                * _get_scale(currency) // 100,
+                "blockedAmount": 0,
+                "closed": False,
+                "creditLimit": 0,
+            })
+        return {"id": "wallet_id", "ref": "12345678", "state": "ACTIVE",
+                "baseCurrency": "EUR", "pockets": raw_pockets}
+
+    def get_started_date(self, index):
+        """ startedDate (ms) of the transaction number index
+        (0 is the oldest one) """
+        return self.end_date - (self.transactions - 1 - index) * self.interval
+
+    def build_transaction(self, index):
+        """ Build the transaction number index, always the same for a seed """
+        rand = random.Random(self.seed * 1000003 + index)
+        pocket = self.wallet["pockets"][index % len(self.wallet["pockets"])]
+        state = rand.choice(_MOCK_TRANSACTION_STATES)
+        started_date = self.get_started_date(index)
+        return {
+            "id": "transaction_{}".format(index),
+            "legId": "leg_{}".format(index),
+            "type": rand.choice(_MOCK_TRANSACTION_TYPES),
+            "state": state,
+            "startedDate": started_date,
+            "updatedDate": started_date,
+            "completedDate": None if state == "PENDING" else started_date,
+            "currency": pocket["currency"],
+            "amount": -rand.randint(1, 100000),
+            "fee": 0,
+            "balance": pocket["balance"],
+            "description": "Payment #{}".format(index),
+            "account": {"id": pocket["id"]},
+        }
+
+    def get_transactions_page(self, from_date=None, to_date=None):
+        """ Transactions with from_date <= startedDate < to_date,
+        the most recent first, at most page_size """
+        stop = self._count_before(to_date)
+        start = max(self._count_before(from_date) if from_date else 0,
+                    stop - self.page_size)
+        return [self.build_transaction(index)
+                for index in range(stop - 1, start - 1, -1)]
+
+    def _count_before(self, date):
+        """ Number of transactions with a startedDate < date """
+        if date is None:
+            return self.transactions
+        count = self.transactions - 1 - (self.end_date - date) // self.interval
+        return min(self.transactions, max(0, count))
+
+    def get_quote(self, from_currency, to_currency, amount):
+        rate = _MOCK_RATES_IN_EUR.get(from_currency, 1.0) \
+            / _MOCK_RATES_IN_EUR.get(to_currency, 1.0)
+        real_amount = amount / _get_scale(from_currency)
+        to_amount = int(real_amount * rate * _get_scale(to_currency))
+        return {
+            "from": {"amount": amount, "currency": from_currency},
+            "to": {"amount": to_amount, "currency": to_currency},
+            "rate": rate,
+        }
+
+    def exchange(self, data):
+        """ Returns (status_code, response) """
+        from_currency, to_currency = data.get("fromCcy"), data.get("toCcy")
+        amount = data.get("fromAmount") or 0
+        pockets = {pocket["currency"]: pocket
+                   for pocket in self.wallet["pockets"]}
+        if from_currency == to_currency or amount <= 0:
+            return 400, {"message": "Invalid exchange"}
+        if from_currency not in pockets or to_currency not in pockets:
+            return 400, {"message": "Unknown pocket"}
+        if pockets[from_currency]["balance"] < amount:
+            return 422, {"message": "Insufficient balance"}
+
+        quote = self.get_quote(from_currency, to_currency, amount)
+        to_amount = quote["to"]["amount"]
+        now = int(time.time()) * 1000
+        with self.lock:
+            pockets[from_currency]["balance"] -= amount
+            pockets[to_currency]["balance"] += to_amount
+        legs = []
+        for currency, leg_amount, counterpart_currency, \
+                counterpart_amount in [
+                    (from_currency, -amount, to_currency, to_amount),
+                    (to_currency, to_amount, from_currency, -amount)]:
+            legs.append({
+                "account": {"id": pockets[currency]["id"]},
+                "amount": leg_amount,
+                "balance": pockets[currency]["balance"],
+                "counterpart": {
+                    "account": {"id": pockets[counterpart_currency]["id"]},
+                    "amount": counterpart_amount,
+                    "currency": counterpart_currency},
+                "currency": currency,
+                "description": "Exchanged to {}".format(to_currency),
+                "fee": 0,
+                "id": "exchange_{}".format(now),
+                "rate": quote["rate"],
+                "startedDate": now,
+                "completedDate": now,
+                "updatedDate": now,
+                "state": "COMPLETED",
+                "type": "EXCHANGE",
+            })
+        return 200, legs
+
+    def get_signin_response(self):
+        return {"user": {"id": "mock_user_id", "state": "ACTIVE"},
+                "wallet": self.wallet,
+                "accessToken": "mock_access_token"}
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass  # Quiet
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        mock = self.server.mock
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        with mock.lock:
+            mock.request_count += 1
+            draw = mock.random.random()
+        if mock.latency:
+            time.sleep(mock.latency)
+        if draw < mock.throttle_rate:
+            return self._send(429, {"message": "Too many requests"},
+                              {"Retry-After": str(mock.retry_after)})
+        if draw < mock.throttle_rate + mock.error_rate:
+            return self._send(500, {"message": "Internal server error"})
+
+        url = urlparse(self.path)
+        params = {key: values[0]
+                  for key, values in parse_qs(url.query).items()}
+        if method == "GET" and url.path == _URL_GET_ACCOUNTS:
+            return self._send(200, mock.wallet)
+        if method == "GET" and url.path == _URL_GET_TRANSACTIONS_LAST:
+            page = mock.get_transactions_page(
+                from_date=int(params["from"]) if "from" in params else None,
+                to_date=int(params["to"]) if "to" in params else None)
+            return self._send(200, page)
+        if method == "GET" and url.path.startswith(_URL_QUOTE):
+            pair = url.path[len(_URL_QUOTE):]
+            return self._send(200, mock.get_quote(
+                pair[:3], pair[3:], int(params.get("amount", 0))))
+        if method == "POST" and url.path == _URL_EXCHANGE:
+            return self._send(*mock.exchange(json.loads(body or b"{}")))
+        if method == "POST" and url.path == _URL_GET_TOKEN_STEP1:
+            return self._send(200, {"channel": "SMS"})
+        if method == "POST" and url.path == _URL_GET_TOKEN_STEP2:
+            return self._send(200, mock.get_signin_response())
+        return self._send(404, {"message": "Not found"})
+
+    def _send(self, status_code, json_obj, headers=None):
+        content = json.dumps(json_obj).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='host to listen on')
+@click.option('--port', '-p', type=int, default=8080, help='port')
+@click.option('--pockets', type=int, default=4, help='number of pockets')
+@click.option('--transactions', '-n', type=int, default=1000,
+              help='number of transactions in the history')
+@click.option('--page-size', type=int, default=_DEFAULT_PAGE_SIZE,
+              help='number of transactions per page')
+@click.option('--latency', type=float, default=0,
+              help='latency added to each response (seconds)')
+@click.option('--error-rate', type=float, default=0,
+              help='probability of a 500 response')
+@click.option('--throttle-rate', type=float, default=0,
+              help='probability of a 429 response')
+@click.option('--retry-after', type=int, default=0,
+              help='Retry-After header of the 429 responses (seconds)')
+@click.option('--seed', type=int, default=0, help='random seed')
+def main(host, port, pockets, transactions, page_size, latency, error_rate,
+         throttle_rate, retry_after, seed):
+    """ Run a local mock of the Revolut API """
+    server = MockRevolutServer(
+        host=host, port=port, pockets=pockets, transactions=transactions,
+        page_size=page_size, latency=latency, error_rate=error_rate,
+        throttle_rate=throttle_rate, retry_after=retry_after, seed=seed)
+    print("Mock Revolut API on {}".format(server.api_base))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Matrix of the exchange rates between currencies, built from the quotes
+of a few pivot currencies only (the other rates are triangulated)
+
+>>> from revolut import Revolut
+>>> rev = Revolut(token="token", device_id="device_id")
+>>> matrix = RateMatrix(rev, ["EUR", "USD", "GBP", "BTC"], pivots=["EUR"])
+"""
+
+from datetime import datetime
+import threading
+import time
+
+from revolut import Amount, _DEFAULT_MAX_CONCURRENCY
+
+_DEFAULT_MAX_AGE = 60  # seconds before the rates are refreshed
+_DEFAULT_QUOTE_AMOUNT = 1000  # real amount of pivot quoted, for precision
+
+
+class RateMatrix:
+    """ Rates between every pair of currencies, from the quotes of each
+    pivot currency in each currency (the only requests sent).
+    The other rates are derived : inverse of a quote, or cross rate through
+    a pivot currency (a => pivot => b).
+
+    The pivot is the quoted side, so that the quote of a currency worth
+    little (ex : IDR) is a large number of its minor units, and the
+    rounding of the quotes is negligible for every currency.
+
+    The rates are refreshed when older than max_age seconds, at the next
+    lookup if auto_refresh is set, otherwise with refresh().
+    quote_amount is the real amount quoted of each pivot currency (a
+    number, or a dict {pivot: amount}) """
+    def __init__(self, revolut, currencies, pivots=("EUR",),
+                 max_age=_DEFAULT_MAX_AGE, auto_refresh=True,
+                 quote_amount=_DEFAULT_QUOTE_AMOUNT,
+                 max_concurrency=_DEFAULT_MAX_CONCURRENCY):
+        self.revolut = revolut
+        self.pivots = list(pivots)
+        # The pivot currencies are part of the matrix
+        self.currencies = list(dict.fromkeys(list(currencies) + self.pivots))
+        self.max_age = max_age
+        self.auto_refresh = auto_refresh
+        self.quote_amount = quote_amount
+        self.max_concurrency = max_concurrency
+        self.date = None  # Date of the last refresh
+        self._indexes = {currency: index for index, currency
+                         in enumerate(self.currencies)}
+        self._rates = None  # [from index][to index] => rate
+        self._derived = None  # [from index][to index] => bool
+        self._refresh_time = None
+        self._lock = threading.Lock()
+
+    def get_legs(self):
+        """ Get the pairs quoted over the network :
+        (pivot currency, currency) for every currency """
+        return [(pivot, currency) for pivot in self.pivots
+                for currency in self.currencies if currency != pivot]
+
+    def _get_quote_amount(self, pivot):
+        if isinstance(self.quote_amount, dict):
+            return self.quote_amount.get(pivot, _DEFAULT_QUOTE_AMOUNT)
+        return self.quote_amount
+
+    def is_stale(self):
+        return self._refresh_time is None or \
+            time.monotonic() - self._refresh_time >= self.max_age
+
+    def refresh(self):
+        """ Quote the legs in parallel, and compute the whole matrix.
+        If a quote fails, its error is raised and the matrix is unchanged """
+        amounts = {pivot: Amount(real_amount=self._get_quote_amount(pivot),
+                                 currency=pivot) for pivot in self.pivots}
+        pairs = [(amounts[pivot], currency)
+                 for pivot, currency in self.get_legs()]
+        quotes = self.revolut.quote_many(
+            pairs, max_concurrency=self.max_concurrency)
+
+        legs = {}  # (pivot, currency) => rate
+        for from_amount, currency in pairs:
+            quote = quotes[(from_amount, currency)]
+            if isinstance(quote, Exception):
+                raise quote
+            legs[(from_amount.currency, currency)] = \
+                quote.real_amount / from_amount.real_amount
+
+        rates, derived = [], []
+        for from_currency in self.currencies:
+            rates.append([])
+            derived.append([])
+            for to_currency in self.currencies:
+                rate, is_derived = self._compute_rate(
+                    legs, from_currency, to_currency)
+                rates[-1].append(rate)
+                derived[-1].append(is_derived)
+
+        with self._lock:
+            self._rates, self._derived = rates, derived
+            self._refresh_time = time.monotonic()
+            self.date = datetime.now()
+
+    def _compute_rate(self, legs, from_currency, to_currency):
+        """ Get (rate, is derived) from the quoted legs """
+        if from_currency == to_currency:
+            return 1.0, False
+        if (from_currency, to_currency) in legs:
+            return legs[(from_currency, to_currency)], False
+        if (to_currency, from_currency) in legs:
+            return 1 / legs[(to_currency, from_currency)], True
+        for pivot in self.pivots:
+            # Neither currency is this pivot (else handled above)
+            from_leg = legs.get((pivot, from_currency))
+            to_leg = legs.get((pivot, to_currency))
+            if from_leg and to_leg is not None:
+                return to_leg / from_leg, True
+        return None, True
+
+    def _get_cell(self, from_currency, to_currency):
+        if self.auto_refresh and self.is_stale():
+            self.refresh()
+        elif self._rates is None:
+            raise ValueError("The rates were never refreshed")
+        i = self._indexes[from_currency]
+        j = self._indexes[to_currency]
+        with self._lock:
+            return self._rates[i][j], self._derived[i][j]
+
+    def get_rate(self, from_currency, to_currency):
+        """ Get the value of 1 from_currency in to_currency """
+        return self._get_cell(from_currency, to_currency)[0]
+
+    def is_derived(self, from_currency, to_currency):
+        """ True if the rate was computed (triangulation or inverse),
+        False if it comes from a quote """
+        return self._get_cell(from_currency, to_currency)[1]
+
+    def convert(self, amount, to_currency):
+        """ Convert an Amount to another currency, with the matrix rate """
+        rate = self.get_rate(amount.currency, to_currency)
+        return Amount(real_amount=amount.real_amount * rate,
+                      currency=to_currency)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Local SQLite store of the account transactions, to sync them incrementally
+"""
+
+from datetime import datetime
+from datetime import timedelta
+import sqlite3
+
+from revolut import AccountTransactions, JsonBackend, _to_timestamp
+
+# Pending transactions may still change state after the last sync,
+# so the transactions started recently are always downloaded again
+_DEFAULT_RECHECK_WINDOW = timedelta(days=3)
+
+
+class TransactionStore:
+    """ Transactions stored in a SQLite file, keyed by transaction id
+
+    >>> store = TransactionStore(":memory:")
+    >>> store.upsert([{"id": "a", "startedDate": 1000, "state": "PENDING"}])
+    >>> store.upsert([{"id": "a", "startedDate": 1000, "state": "COMPLETED"},
+    ...               {"id": "b", "startedDate": 2000, "state": "PENDING"}])
+    >>> len(store), store.get_high_water_mark()
+    (2, 2000)
+    >>> [tr["state"] for tr in store.get_raw_transactions()]
+    ['PENDING', 'COMPLETED']
+    >>> store.get_oldest_pending_date()
+    2000
+    >>> store.get_synced_from() is None
+    True
+    >>> store.set_synced_from(500)
+    >>> store.get_synced_from()
+    500
+    """
+    def __init__(self, filename="revolut_transactions.sqlite",
+                 json_backend=None):
+        self.filename = filename
+        self.json_backend = JsonBackend(json_backend)
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS transactions ("
+            "id TEXT PRIMARY KEY, "
+            "started_date INTEGER NOT NULL, "
+            "state TEXT, "
+            "raw TEXT NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS transactions_started_date "
+            "ON transactions (started_date)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state ("
+            "name TEXT PRIMARY KEY, "
+            "value INTEGER)")
+        self.connection.commit()
+
+    def __len__(self):
+        cursor = self.connection.execute("SELECT COUNT(*) FROM transactions")
+        return cursor.fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def upsert(self, raw_transactions):
+        """ Insert the transactions, or update them if already stored """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO transactions "
+                "(id, started_date, state, raw) VALUES (?, ?, ?, ?)",
+                ((tr["id"], tr["startedDate"], tr.get("state"),
+                  self.json_backend.dumps(tr))
+                 for tr in raw_transactions))
+
+    def get_high_water_mark(self):
+        """ Get the startedDate (ms) of the most recent transaction stored,
+        or None if the store is empty """
+        cursor = self.connection.execute(
+            "SELECT MAX(started_date) FROM transactions")
+        return cursor.fetchone()[0]
+
+    def get_oldest_pending_date(self):
+        """ Get the startedDate (ms) of the oldest PENDING transaction
+        stored, or None if there is none """
+        cursor = self.connection.execute(
+            "SELECT MIN(started_date) FROM transactions "
+            "WHERE state = 'PENDING'")
+        return cursor.fetchone()[0]
+
+    def get_synced_from(self):
+        """ Get the start (ms) of the period already synced, 0 if it is the
+        whole history, or None if the store was never synced """
+        row = self.connection.execute(
+            "SELECT value FROM sync_state WHERE name = 'synced_from'"
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def set_synced_from(self, synced_from):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sync_state (name, value) "
+                "VALUES ('synced_from', ?)", (synced_from,))
+
+    def get_raw_transactions(self, from_date=None, to_date=None):
+        """ Get the raw transactions, the most recent first
+        (same order as the Revolut API) """
+        query = "SELECT raw FROM transactions WHERE 1"
+        params = []
+        if from_date:
+            query += " AND started_date >= ?"
+            params.append(int(from_date.timestamp()) * 1000)
+        if to_date:
+            query += " AND started_date <= ?"
+            params.append(int(to_date.timestamp()) * 1000)
+        query += " ORDER BY started_date DESC, id"
+        return [self.json_backend.loads(raw)
+                for raw, in self.connection.execute(query, params)]
+
+    def get_account_transactions(self, from_date=None, to_date=None):
+        return AccountTransactions(
+            self.get_raw_transactions(from_date=from_date, to_date=to_date))
+
+
+def sync_account_transactions(revolut, store, from_date=None,
+                              recheck_window=_DEFAULT_RECHECK_WINDOW):
+    """ Download the transactions newer than the ones in the store, minus
+    recheck_window (or from the oldest PENDING one, if older : it may have
+    changed state since) and save them.
+    If from_date (None : the whole history) is before the period already
+    synced, the transactions between from_date and this period are
+    downloaded too.
+    Returns the number of transactions downloaded """
+    high_water_mark = store.get_high_water_mark()
+    synced_from = store.get_synced_from()
+    requested_from = _to_timestamp(from_date) if from_date else 0
+
+    windows = []  # (from_date, to_date) to download
+    if high_water_mark is None or synced_from is None:
+        windows.append((from_date, None))
+    else:
+        if requested_from < synced_from:
+            windows.append((from_date,
+                            datetime.fromtimestamp(synced_from / 1000)))
+        recheck_from = datetime.fromtimestamp(high_water_mark / 1000) \
+            - recheck_window
+        oldest_pending_date = store.get_oldest_pending_date()
+        if oldest_pending_date is not None:
+            recheck_from = min(recheck_from, datetime.fromtimestamp(
+                oldest_pending_date / 1000))
+        windows.append((recheck_from, None))
+
+    count = 0
+    for window_from_date, window_to_date in windows:
+        for page in revolut._iter_raw_transactions_pages(
+                from_date=window_from_date, to_date=window_to_date):
+            store.upsert(page)
+            count += len(page)
+
+    if synced_from is None or requested_from < synced_from:
+        store.set_synced_from(requested_from)
+    return count
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar (NumPy) view of the account transactions, for analytics
+
+NumPy is an optional dependency : pip3 install revolut[analytics]
+"""
+
+import numpy as np
+
+from revolut import Amount, _to_timestamp
+
+_MISSING_DATE = -1  # completed_date of the pending transactions
+
+# Categorical columns : stored as integer codes + list of categories
+_CATEGORICAL_COLUMNS = ["transactions_type", "state", "currency",
+                        "account_id"]
+
+
+class TransactionTable:
+    """ Class to handle the account transactions as columns
+
+    amount, fee, started_date and completed_date are int64 arrays
+    (amounts in Revolut minor units, dates as timestamps in ms).
+    transactions_type, state, currency and account_id are int32 codes,
+    with their values in self.categories[column_name] """
+
+    def __init__(self, columns, categories):
+        self.columns = columns
+        self.categories = categories
+
+    @classmethod
+    def from_raw(cls, raw_transactions):
+        """ Build the table from raw transactions (as AccountTransactions) """
+        amounts, fees, started_dates, completed_dates = [], [], [], []
+        descriptions = []
+        codes = {name: [] for name in _CATEGORICAL_COLUMNS}
+        code_dicts = {name: {} for name in _CATEGORICAL_COLUMNS}
+
+        for transaction in raw_transactions:
+            amounts.append(transaction.get("amount"))
+            fees.append(transaction.get("fee") or 0)
+            started_dates.append(transaction.get("startedDate"))
+            completed_date = transaction.get("completedDate")
+            completed_dates.append(_MISSING_DATE if completed_date is None
+                                   else completed_date)
+            descriptions.append(transaction.get("description"))
+            values = (transaction.get("type"),
+                      transaction.get("state"),
+                      transaction.get("currency"),
+                      transaction.get("account").get("id"))
+            for name, value in zip(_CATEGORICAL_COLUMNS, values):
+                code_dict = code_dicts[name]
+                codes[name].append(code_dict.setdefault(value, len(code_dict)))
+
+        columns = {
+            "amount": np.array(amounts, dtype=np.int64),
+            "fee": np.array(fees, dtype=np.int64),
+            "started_date": np.array(started_dates, dtype=np.int64),
+            "completed_date": np.array(completed_dates, dtype=np.int64),
+            "description": np.array(descriptions, dtype=object),
+        }
+        for name in _CATEGORICAL_COLUMNS:
+            columns[name] = np.array(codes[name], dtype=np.int32)
+        categories = {name: list(code_dicts[name])
+                      for name in _CATEGORICAL_COLUMNS}
+        return cls(columns, categories)
+
+    def __len__(self):
+        return len(self.columns["amount"])
+
+    def __getitem__(self, key):
+        """ Get a column (ex : table["amount"]).
+        Categorical columns are returned decoded """
+        if key in self.categories:
+            categories = np.array(self.categories[key], dtype=object)
+            return categories[self.columns[key]]
+        return self.columns[key]
+
+    def take(self, mask):
+        """ Get a new table with the rows selected by a boolean mask
+        (or an array of indexes) """
+        return TransactionTable(
+            {name: column[mask] for name, column in self.columns.items()},
+            self.categories)
+
+    def get_mask(self, **criteria):
+        """ Get the boolean mask of the rows matching every criterion,
+        ex : get_mask(state="COMPLETED", currency=["EUR", "USD"]) """
+        mask = np.ones(len(self), dtype=bool)
+        for name, values in criteria.items():
+            if name not in self.categories:
+                raise KeyError(name)
+            if isinstance(values, str):
+                values = [values]
+            categories = self.categories[name]
+            value_codes = [categories.index(value) for value in values
+                           if value in categories]
+            mask &= np.isin(self.columns[name], value_codes)
+        return mask
+
+    def filter(self, **criteria):
+        """ Get the rows matching every criterion (see get_mask) """
+        return self.take(self.get_mask(**criteria))
+
+    def between(self, from_date=None, to_date=None, column="started_date"):
+        """ Get the rows with from_date <= date < to_date
+        (datetime objects or timestamps in ms) """
+        dates = self.columns[column]
+        mask = np.ones(len(self), dtype=bool)
+        if from_date is not None:
+            mask &= dates >= _to_timestamp(from_date)
+        if to_date is not None:
+            mask &= dates < _to_timestamp(to_date)
+        return self.take(mask)
+
+    def sum_by_currency(self, column="amount"):
+        """ Sum a column (amount or fee) for each currency,
+        returns a dict {currency: Amount} """
+        currencies = self.categories["currency"]
+        sums = np.zeros(len(currencies), dtype=np.int64)
+        np.add.at(sums, self.columns["currency"], self.columns[column])
+        present = np.bincount(self.columns["currency"],
+                              minlength=len(currencies)) > 0
+        return {currency: Amount(revolut_amount=int(total), currency=currency)
+                for currency, total, is_present
+                in zip(currencies, sums, present) if is_present}
@@ -6,11 +6,13 @@ This package allows you to control the Revolut bot
 import csv
 from datetime import datetime
 import io
+import os
 
 from revolut import Amount, Transaction
 
 _CSV_COLUMNS = ["date", "hour", "from_amount", "from_currency",
                 "to_amount", "to_currency"]
+_TAIL_BLOCK_SIZE = 4096  # bytes read at once from the end of a history file
 
 
 def csv_to_dict(csv_str, separator=","):
@@ -30,6 +32,7 @@ def csv_to_dict(csv_str, separator=","):
 def append_dict_to_csv(filename, dict_obj, separator=",",
                        col_names=_CSV_COLUMNS):
     """ Append a dict object, to a csv file """
+    _add_missing_final_newline(filename)
     with open(filename, 'a', newline='\n') as csvfile:
         writer = csv.DictWriter(csvfile,
                                 delimiter=separator,
@@ -38,6 +41,19 @@ def append_dict_to_csv(filename, dict_obj, separator=",",
         writer.writerow(dict_obj)
 
 
+def _add_missing_final_newline(filename):
+    """ Make sure that a new row will not be appended to the last one """
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'rb+') as f:
+        f.seek(0, io.SEEK_END)
+        if f.tell() == 0:
+            return
+        f.seek(-1, io.SEEK_END)
+        if f.read(1) != b'\n':
+            f.write(b'\n')
+
+
 def convert_Transaction_to_dict(transaction_obj):
     return {
         "date": transaction_obj.date.strftime("%d/%m/%Y"),
@@ -69,6 +85,36 @@ def get_last_transactions_from_csv(filename="exchange_history.csv",
     return list(map(dict_transaction_to_Transaction, last_transactions))
 
 
+def get_last_transaction(filename="exchange_history.csv", separator=","):
+    """ Get the last transaction of a history file, reading only its header
+    and its last row (from the end of the file) """
+    with open(filename, 'rb') as f:
+        header = f.readline()
+        last_line = _read_last_line(f, start=f.tell())
+    if last_line is None:
+        raise IndexError("No transaction in {}".format(filename))
+
+    csv_str = (header.rstrip(b"\r\n") + b"\n" + last_line).decode("utf-8")
+    tr_dict = csv_to_dict(csv_str=csv_str, separator=separator)[0]
+    return dict_transaction_to_Transaction(tr_dict)
+
+
+def _read_last_line(f, start=0):
+    """ Read the last non-empty line of a binary file, after start,
+    by blocks from the end of the file. Returns None if there is none """
+    position = f.seek(0, io.SEEK_END)
+    data = b""
+    while position > start:
+        size = min(_TAIL_BLOCK_SIZE, position - start)
+        position -= size
+        f.seek(position)
+        data = f.read(size) + data
+        lines = data.rstrip(b"\r\n").rsplit(b"\n", 1)
+        if len(lines) == 2:
+            return lines[1].rstrip(b"\r")
+    return data.rstrip(b"\r\n") or None
+
+
 def dict_transaction_to_Transaction(tr_dict):
     """ Converts a transaction dictionnary to a Transaction object """
     if set(tr_dict) != set(_CSV_COLUMNS):
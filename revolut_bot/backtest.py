@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Backtest of the margin strategy of revolutbot.py on a history of rates,
+to choose the margin (_BOT_PERCENT_MARGIN)
+
+NumPy is an optional dependency : pip3 install revolut[analytics]
+Usage : python -m revolut_bot.backtest --help
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from datetime import datetime
+import itertools
+import json
+
+import click
+import numpy as np
+
+import revolut_bot
+from revolut import Amount
+
+_DEFAULT_INITIAL_AMOUNT = 100  # in the base currency of the pair
+_DEFAULT_MARGINS = "0.5,1,2,5"
+_SEARCH_CHUNK_SIZE = 1024  # first number of rates checked for the next trade
+
+
+def load_rates_csv(filename):
+    """ Load a csv of rates : a date column (ISO 8601), then one column per
+    pair, named BASE/QUOTE (ex : "EUR/USD") with the value of 1 BASE in QUOTE.
+    Empty cells are ignored.
+    Returns a dict {(base, quote): (dates, rates)}, sorted by date """
+    with open(filename) as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [row for row in reader if row]
+
+    dates = np.array([row[0] for row in rows], dtype="datetime64[s]")
+    order = np.argsort(dates, kind="stable")
+    series = {}
+    for column, name in enumerate(header[1:], start=1):
+        base, quote = name.strip().split("/")
+        rates = np.array([float(row[column]) if row[column] else np.nan
+                          for row in rows])[order]
+        present = ~np.isnan(rates)
+        series[(base, quote)] = (dates[order][present], rates[present])
+    return series
+
+
+def _find_next_trade(values_func, rates, start, threshold):
+    """ Get the first index >= start where values_func(rates) > threshold
+    (None if there is none). The rates are checked by growing chunks, so
+    a trade found soon does not cost a pass over the whole series """
+    size = _SEARCH_CHUNK_SIZE
+    while start < len(rates):
+        hits = values_func(rates[start:start + size]) > threshold
+        index = int(hits.argmax())
+        if hits[index]:
+            return start + index
+        start += size
+        size *= 2
+    return None
+
+
+def backtest(dates, rates, percent_margin, pair=("EUR", "USD"),
+             start_date=None, initial_amount=_DEFAULT_INITIAL_AMOUNT):
+    """ Replay the bot on the rates of a pair (value of 1 base in quote),
+    from start_date (the first date by default) : initial_amount of base
+    currency is bought at the first rate, then the bot exchanges everything
+    each time the other currency is worth more than the last amount sold,
+    plus percent_margin (same decision as revolutbot.buy_or_not).
+    Returns a dict with the final balance, the number of trades, and the
+    maximum drawdown of the value in the base currency
+
+    >>> dates = np.array(["2018-01-01", "2018-01-02", "2018-01-03",
+    ...                   "2018-01-04"], dtype="datetime64[s]")
+    >>> result = backtest(dates, np.array([1.2, 1.3, 1.1, 1.15]),
+    ...                   percent_margin=5)
+    >>> result["trades"], result["final_currency"]
+    (2, 'EUR')
+    >>> round(result["final_amount"], 2)
+    118.18
+    """
+    base, quote = pair
+    if start_date is not None:
+        start = int(np.searchsorted(dates, np.datetime64(start_date, "s")))
+    else:
+        start = 0
+    if start >= len(rates):
+        raise IndexError("No rate after {}".format(start_date))
+
+    currency, other_currency = base, quote
+    amount = float(initial_amount)
+    last_sell = amount * float(rates[start])  # The first purchase, in quote
+    trade_indexes, amounts = [start], [amount]
+
+    index = start + 1
+    while True:
+        last_sell_plus_margin = revolut_bot.get_amount_with_margin(
+            amount=Amount(real_amount=last_sell, currency=other_currency),
+            percent_margin=percent_margin).real_amount
+        if currency == base:
+            def values_func(r, amount=amount):
+                return amount * r
+        else:
+            def values_func(r, amount=amount):
+                return amount / r
+        index = _find_next_trade(values_func, rates, index,
+                                 last_sell_plus_margin)
+        if index is None:
+            break
+        # Everything is exchanged to the other currency
+        last_sell, amount = amount, float(values_func(rates[index]))
+        currency, other_currency = other_currency, currency
+        trade_indexes.append(index)
+        amounts.append(amount)
+        index += 1
+
+    # Value of the balance in the base currency, at each date
+    segments = np.searchsorted(trade_indexes,
+                               np.arange(start, len(rates)), side="right") - 1
+    segment_amounts = np.array(amounts)[segments]
+    in_quote = segments % 2 == 1  # The base and quote currencies alternate
+    values = np.where(in_quote, segment_amounts / rates[start:],
+                      segment_amounts)
+    peaks = np.maximum.accumulate(values)
+    max_drawdown = float(((peaks - values) / peaks).max())
+
+    return {
+        "pair": "{}/{}".format(base, quote),
+        "percent_margin": percent_margin,
+        "start_date": str(dates[start]),
+        "trades": len(trade_indexes) - 1,
+        "final_amount": amount,
+        "final_currency": currency,
+        "final_value": float(values[-1]),
+        "return_percent": (float(values[-1]) / initial_amount - 1) * 100,
+        "max_drawdown_percent": max_drawdown * 100,
+    }
+
+
+def _run_sweep_chunk(task):
+    pair, dates, rates, jobs, initial_amount = task
+    return [backtest(dates, rates, percent_margin, pair=pair,
+                     start_date=start_date, initial_amount=initial_amount)
+            for percent_margin, start_date in jobs]
+
+
+def sweep(series, margins, start_dates=(None,),
+          initial_amount=_DEFAULT_INITIAL_AMOUNT, max_workers=None):
+    """ Backtest every combination of pair (series being a dict
+    {(base, quote): (dates, rates)}, as returned by load_rates_csv), margin
+    and start date, on a pool of processes.
+    Returns the list of the backtest results """
+    jobs = list(itertools.product(margins, start_dates))
+    chunk_size = max(1, len(series) * len(jobs) // 64)
+    # The rates of a pair are sent with each chunk of its jobs,
+    # not with every job
+    tasks = [(pair, dates, rates, jobs[i:i + chunk_size], initial_amount)
+             for pair, (dates, rates) in series.items()
+             for i in range(0, len(jobs), chunk_size)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return [result for results in executor.map(_run_sweep_chunk, tasks)
+                for result in results]
+
+
+@click.command()
+@click.argument('rates_files', nargs=-1, required=True,
+                type=click.Path(exists=True, dir_okay=False))
+@click.option('--margins', '-m', default=_DEFAULT_MARGINS,
+              help='margins (%) to test, comma separated')
+@click.option('--start-date', '-s', 'start_dates', multiple=True,
+              type=click.DateTime(), help='start date (repeat it to test '
+              'several ones, default : the first date of each pair)')
+@click.option('--initial-amount', type=float,
+              default=_DEFAULT_INITIAL_AMOUNT,
+              help='initial amount, in the base currency of each pair')
+@click.option('--workers', '-w', type=int,
+              help='number of processes (default : number of CPUs)')
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='JSON output file (default : stdout)')
+def main(rates_files, margins, start_dates, initial_amount, workers, output):
+    """ Backtest the bot on the rates of RATES_FILES (csv : date,EUR/USD,...)
+    and write the results as JSON """
+    series = {}
+    for filename in rates_files:
+        series.update(load_rates_csv(filename))
+    margins = [float(margin) for margin in margins.split(",") if margin]
+    results = sweep(series, margins,
+                    start_dates=list(start_dates) or [None],
+                    initial_amount=initial_amount, max_workers=workers)
+    json.dump({"date": datetime.now().isoformat(), "results": results},
+              output, indent=2)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
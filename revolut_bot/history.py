@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Backends of the exchange history of the bot : the csv file (default),
+or a SQLite table indexed by date, for large histories
+
+The backend is chosen from the file extension, see open_history.
+To convert a history : python -m revolut_bot.history --help
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+import os
+
+import click
+
+import revolut_bot
+from revolut import Amount, Transaction, _SCALE_FACTOR_CURRENCY_DICT, \
+    _DEFAULT_SCALE_FACTOR
+
+_SQLITE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"  # Sorts like the dates
+
+
+class HistoryBackend(ABC):
+    """ Exchange history of the bot, the oldest transaction first """
+    @abstractmethod
+    def append(self, transaction):
+        pass
+
+    def extend(self, transactions):
+        for transaction in transactions:
+            self.append(transaction)
+
+    @abstractmethod
+    def get_last_transaction(self):
+        """ Get the most recent transaction, IndexError if there is none """
+
+    @abstractmethod
+    def get_transactions(self, from_date=None, to_date=None):
+        """ Get the transactions with from_date <= date <= to_date """
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvHistory(HistoryBackend):
+    """ History in a csv file, with the revolut_bot._CSV_COLUMNS header """
+    def __init__(self, filename):
+        self.filename = filename
+
+    def append(self, transaction):
+        # The header is missing from a new (or empty) file
+        if not os.path.exists(self.filename) or \
+                os.path.getsize(self.filename) == 0:
+            with open(self.filename, "w") as f:
+                f.write(",".join(revolut_bot._CSV_COLUMNS) + "\n")
+        revolut_bot.update_historyfile(filename=self.filename,
+                                       exchange_transaction=transaction)
+
+    def get_last_transaction(self):
+        return revolut_bot.get_last_transaction(filename=self.filename)
+
+    def get_transactions(self, from_date=None, to_date=None):
+        return [transaction for transaction
+                in revolut_bot.get_last_transactions_from_csv(
+                    filename=self.filename)
+                if (from_date is None or transaction.date >= from_date) and
+                (to_date is None or transaction.date <= to_date)]
+
+
+class SqliteHistory(HistoryBackend):
+    """ History in a SQLite table, indexed by date. The amounts are stored
+    in Revolut minor units (Amount.revolut_amount)
+
+    >>> history = SqliteHistory(":memory:")
+    >>> history.append(Transaction(
+    ...     from_amount=Amount(real_amount=10, currency="USD"),
+    ...     to_amount=Amount(real_amount=8.66, currency="EUR"),
+    ...     date=datetime(2018, 7, 10, 16, 30)))
+    >>> print(history.get_last_transaction())
+    (10/07/2018 16:30:00) 10.00 USD => 8.66 EUR
+    """
+    def __init__(self, filename):
+        import sqlite3  # Not needed by the csv history of the bot
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS exchanges ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "date TEXT NOT NULL, "
+            "from_amount INTEGER NOT NULL, "
+            "from_currency TEXT NOT NULL, "
+            "to_amount INTEGER NOT NULL, "
+            "to_currency TEXT NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS exchanges_date ON exchanges (date)")
+        self.connection.commit()
+
+    def __len__(self):
+        cursor = self.connection.execute("SELECT COUNT(*) FROM exchanges")
+        return cursor.fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def append(self, transaction):
+        self.extend([transaction])
+
+    def extend(self, transactions):
+        """ Append the transactions, in a single database transaction """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO exchanges (date, from_amount, from_currency, "
+                "to_amount, to_currency) VALUES (?, ?, ?, ?, ?)",
+                ((tr.date.strftime(_SQLITE_DATE_FORMAT),
+                  _get_minor_units(tr.from_amount), tr.from_amount.currency,
+                  _get_minor_units(tr.to_amount), tr.to_amount.currency)
+                 for tr in transactions))
+
+    def get_last_transaction(self):
+        # The last row inserted (rowid lookup), as in the csv file
+        row = self.connection.execute(
+            "SELECT date, from_amount, from_currency, to_amount, to_currency "
+            "FROM exchanges ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            raise IndexError("No transaction in {}".format(self.filename))
+        return _row_to_Transaction(row)
+
+    def get_transactions(self, from_date=None, to_date=None):
+        query = ("SELECT date, from_amount, from_currency, to_amount, "
+                 "to_currency FROM exchanges WHERE 1")
+        params = []
+        if from_date:
+            query += " AND date >= ?"
+            params.append(from_date.strftime(_SQLITE_DATE_FORMAT))
+        if to_date:
+            query += " AND date <= ?"
+            params.append(to_date.strftime(_SQLITE_DATE_FORMAT))
+        query += " ORDER BY date, id"
+        return [_row_to_Transaction(row)
+                for row in self.connection.execute(query, params)]
+
+
+def _get_minor_units(amount):
+    """ Get the Revolut amount of an Amount, rounded : revolut_amount is
+    truncated for an Amount built from a real amount
+    >>> amount = Amount(real_amount=1.15, currency="USD")
+    >>> amount.revolut_amount, _get_minor_units(amount)
+    (114, 115)
+    """
+    scale = _SCALE_FACTOR_CURRENCY_DICT.get(amount.currency,
+                                            _DEFAULT_SCALE_FACTOR)
+    return int(round(amount.real_amount * scale))
+
+
+def _row_to_Transaction(row):
+    date, from_amount, from_currency, to_amount, to_currency = row
+    return Transaction(
+        from_amount=Amount(revolut_amount=from_amount, currency=from_currency),
+        to_amount=Amount(revolut_amount=to_amount, currency=to_currency),
+        date=datetime.strptime(date, _SQLITE_DATE_FORMAT))
+
+
+# File extension => backend (CsvHistory for the other extensions)
+_HISTORY_BACKENDS = {
+    ".sqlite": SqliteHistory,
+    ".sqlite3": SqliteHistory,
+    ".db": SqliteHistory,
+}
+
+
+def open_history(filename):
+    """ Open a history file, with the backend matching its extension
+    >>> type(open_history("exchange_history.csv")).__name__
+    'CsvHistory'
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    return _HISTORY_BACKENDS.get(extension, CsvHistory)(filename)
+
+
+def convert_history(source, destination):
+    """ Copy every transaction of a history file into another one
+    (ex : from exchange_history.csv to exchange_history.sqlite).
+    Returns the number of transactions copied """
+    with open_history(source) as source_history, \
+            open_history(destination) as destination_history:
+        transactions = source_history.get_transactions()
+        destination_history.extend(transactions)
+    return len(transactions)
+
+
+@click.command()
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.argument('destination', type=click.Path(dir_okay=False))
+def main(source, destination):
+    """ Convert the exchange history SOURCE into DESTINATION,
+    the formats being chosen from the extensions (.csv, .sqlite) """
+    if os.path.exists(destination):
+        raise click.UsageError("{} already exists".format(destination))
+    count = convert_history(source, destination)
+    print("{} transactions copied to {}".format(count, destination))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import click
-import json
 import os
+import sys
 
 from datetime import datetime
 from datetime import timedelta
 
-from revolut import Revolut, __version__
+from revolut import Revolut, __version__, write_transactions_csv, \
+    write_transactions_ndjson
 
 
 @click.command()
@@ -39,8 +40,9 @@ from revolut import Revolut, __version__
 )
 @click.option(
     '--output_format', '-fmt',
-    type=click.Choice(['csv', 'json']),
-    help="output format",
+    type=click.Choice(['csv', 'json', 'ndjson']),
+    help="output format (ndjson : one transaction per line, "
+         "written as each page is downloaded)",
     default='csv',
 )
 @click.option(
@@ -48,21 +50,55 @@ from revolut import Revolut, __version__
     is_flag=True,
     help='reverse the order of the transactions displayed',
 )
-def main(device_id, token, language, from_date, output_format, reverse):
+@click.option(
+    '--store', '-s',
+    type=click.Path(dir_okay=False),
+    help='SQLite file to keep the transactions locally, '
+         'and only download the ones not stored yet',
+)
+def main(device_id, token, language, from_date, output_format, reverse,
+         store):
     """ Get the account balances on Revolut """
     if token is None:
         print("You don't seem to have a Revolut token. Use 'revolut_cli' to obtain one")
         exit(1)
 
     rev = Revolut(device_id=device_id, token=token)
-    account_transactions = rev.get_account_transactions(from_date)
+    if store:
+        # Imported only if needed, for a faster startup
+        from revolut.store import TransactionStore, sync_account_transactions
+        transaction_store = TransactionStore(store)
+        sync_account_transactions(rev, transaction_store, from_date=from_date)
+        account_transactions = transaction_store.get_account_transactions(
+            from_date=from_date)
+        transaction_store.close()
+    elif output_format == 'csv' and not reverse:
+        # Write each page as soon as it is downloaded
+        account_transactions = rev.iter_account_transactions(from_date)
+    elif output_format == 'ndjson' and not reverse:
+        write_transactions_ndjson(
+            sys.stdout,
+            rev.iter_account_transactions(from_date, pages=True, raw=True),
+            json_backend=rev.client.json_backend)
+        return
+    else:
+        account_transactions = rev.get_account_transactions(from_date)
     if output_format == 'csv':
-        print(account_transactions.csv(lang=language, reverse=reverse))
+        if reverse:
+            account_transactions = reversed(account_transactions.list)
+        write_transactions_csv(sys.stdout, account_transactions,
+                               lang=language)
     elif output_format == 'json':
         transactions = account_transactions.raw_list
         if reverse:
             transactions = reversed(transactions)
-        print(json.dumps(transactions))
+        print(rev.client.json_backend.dumps(list(transactions)))
+    elif output_format == 'ndjson':
+        transactions = account_transactions.raw_list
+        if reverse:
+            transactions = reversed(transactions)
+        write_transactions_ndjson(sys.stdout, [transactions],
+                                  json_backend=rev.client.json_backend)
     else:
         print("output format {!r} not implemented".format(output_format))
         exit(1)
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import click
+from datetime import datetime
+import logging
+import os
 from revolut import Revolut, __version__
 import revolut_bot
+from revolut_bot.history import open_history
+import signal
 import sys
+import threading
 
 # Usage : revolutbot.py --help
 
@@ -13,6 +19,13 @@ _VERBOSE_MODE = False  # can be changed with --verbose parameter
 _RETURN_CODE_BUY = 0
 _RETURN_CODE_DO_NOT_BUY = 1
 _RETURN_CODE_ERROR = 2
+_DECISION_NAMES = {
+    _RETURN_CODE_BUY: "BUY",
+    _RETURN_CODE_DO_NOT_BUY: "DO_NOT_BUY",
+    _RETURN_CODE_ERROR: "ERROR",
+}
+
+logger = logging.getLogger("revolutbot")
 
 
 @click.command()
@@ -32,8 +45,22 @@ _RETURN_CODE_ERROR = 2
 @click.option(
     '--historyfile', '-f',
     type=str,
-    help='csv file with the exchange history',
-    required=True,
+    multiple=True,
+    help='exchange history file, .csv or .sqlite (repeat it to run the bot '
+         'on several currency pairs)',
+)
+@click.option(
+    '--config', '-c',
+    type=click.Path(exists=True, dir_okay=False),
+    help='json file listing the history files and their margins : '
+         '[{"historyfile": "eur_usd.csv", "margin": 1}, ...]',
+)
+@click.option(
+    '--margin', '-m',
+    type=float,
+    default=_BOT_PERCENT_MARGIN,
+    help='minimum benefit (%) to exchange, for the --historyfile options',
+    show_default=True,
 )
 @click.option(
     '--forceexchange',
@@ -50,11 +77,39 @@ _RETURN_CODE_ERROR = 2
     is_flag=True,
     help='verbose mode',
 )
+@click.option(
+    '--daemon',
+    is_flag=True,
+    help='keep running, and run the bot every --interval seconds',
+)
+@click.option(
+    '--interval', '-i',
+    type=click.IntRange(min=1),
+    default=60,
+    help='seconds between two runs, in daemon mode',
+    show_default=True,
+)
+@click.option(
+    '--statusfile',
+    type=click.Path(dir_okay=False),
+    help='json file updated with the last decision, in daemon mode',
+)
 @click.version_option(
     version=__version__,
     message='%(prog)s, based on [revolut] package version %(version)s'
 )
-def main(device_id, token, simulate, historyfile, verbose, forceexchange):
+def main(device_id, token, simulate, historyfile, config, margin, verbose,
+         forceexchange, daemon, interval, statusfile):
+    """ Exchange when the rate is good enough, from the last transaction of
+    each history file. With several history files, the quotes are fetched
+    concurrently and the exit code is ERROR if any pair failed, else BUY if
+    any pair was bought, else DO_NOT_BUY """
+    bots = [(filename, margin) for filename in historyfile]
+    if config:
+        bots.extend(read_bots_config(config))
+    if not bots:
+        raise click.UsageError("--historyfile or --config is required")
+
     if token is None:
         print("You don't seem to have a Revolut token")
         print("Please execute revolut_cli.py first to get one")
@@ -64,10 +119,38 @@ def main(device_id, token, simulate, historyfile, verbose, forceexchange):
     _VERBOSE_MODE = verbose
     rev = Revolut(device_id=device_id, token=token)
 
-    to_buy_or_not_to_buy(revolut=rev,
-                         simulate=simulate,
-                         filename=historyfile,
-                         forceexchange=forceexchange)
+    if daemon:
+        if forceexchange:
+            raise click.UsageError(
+                "--forceexchange can not be used with --daemon")
+        logging.basicConfig(level=logging.INFO,
+                            format="%(asctime)s %(levelname)s %(message)s")
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            logger.info("Signal %s received, stopping", signum)
+            stop_event.set()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        run_daemon(revolut=rev,
+                   simulate=simulate,
+                   bots=bots,
+                   interval=interval,
+                   statusfile=statusfile,
+                   stop_event=stop_event)
+    elif len(bots) == 1:
+        filename, percent_margin = bots[0]
+        to_buy_or_not_to_buy(revolut=rev,
+                             simulate=simulate,
+                             filename=filename,
+                             forceexchange=forceexchange,
+                             percent_margin=percent_margin)
+    else:
+        to_buy_or_not_to_buy_many(revolut=rev,
+                                  simulate=simulate,
+                                  bots=bots,
+                                  forceexchange=forceexchange)
 
 
 def log(log_str=""):
@@ -75,21 +158,133 @@ def log(log_str=""):
         print(log_str)
 
 
-def to_buy_or_not_to_buy(revolut, simulate, filename, forceexchange):
-    percent_margin = _BOT_PERCENT_MARGIN
+def read_bots_config(filename):
+    """ Read the json list of {"historyfile": ..., "margin": ...}
+    (the margin is optional), returns a list of (historyfile, margin) """
+    import json  # Imported only if needed, for a faster startup
+    with open(filename) as f:
+        config = json.load(f)
+    if not isinstance(config, list):
+        raise TypeError("The config must be a list of history files")
+    return [(bot["historyfile"], bot.get("margin", _BOT_PERCENT_MARGIN))
+            for bot in config]
+
+
+def get_last_transaction(filename):
+    """ Get the last transaction of a history file (csv or sqlite) """
+    with open_history(filename) as history:
+        return history.get_last_transaction()
+
+
+def update_history(filename, exchange_transaction):
+    """ Append the exchange transaction to a history file (csv or sqlite) """
+    with open_history(filename) as history:
+        history.append(exchange_transaction)
 
-    last_transactions = revolut_bot.get_last_transactions_from_csv(
-                        filename=filename)
-    last_tr = last_transactions[-1]  # The last transaction
+
+def to_buy_or_not_to_buy(revolut, simulate, filename, forceexchange,
+                         percent_margin=_BOT_PERCENT_MARGIN):
+    last_tr = get_last_transaction(filename)
+
+    decision, exchange_transaction = buy_or_not(
+                        revolut=revolut,
+                        last_tr=last_tr,
+                        simulate=simulate,
+                        forceexchange=forceexchange,
+                        percent_margin=percent_margin)
+    if exchange_transaction is not None:
+        log("Update history file : {}".format(filename))
+        update_history(filename, exchange_transaction)
+    sys.exit(decision)
+
+
+def to_buy_or_not_to_buy_many(revolut, simulate, bots, forceexchange):
+    """ Run the bot on several history files, bots being a list of
+    (historyfile, percent_margin). The decision of each pair is printed """
+    last_transactions = {filename: get_last_transaction(filename)
+                         for filename, _ in bots}
+    decisions = buy_or_not_many(
+                        revolut=revolut,
+                        last_transactions=last_transactions,
+                        simulate=simulate,
+                        percent_margins=dict(bots),
+                        forceexchange=forceexchange)
+
+    for filename, (decision, exchange_transaction) in decisions.items():
+        if exchange_transaction is not None:
+            log("Update history file : {}".format(filename))
+            update_history(filename, exchange_transaction)
+        print("{} : {}".format(filename, _DECISION_NAMES[decision]))
+    sys.exit(get_global_decision(
+        [decision for decision, _ in decisions.values()]))
+
+
+def get_global_decision(decisions):
+    """ Exit code of a run on several pairs
+    >>> get_global_decision([_RETURN_CODE_DO_NOT_BUY, _RETURN_CODE_BUY])
+    0
+    >>> get_global_decision([_RETURN_CODE_BUY, _RETURN_CODE_ERROR])
+    2
+    """
+    if _RETURN_CODE_ERROR in decisions:
+        return _RETURN_CODE_ERROR
+    if _RETURN_CODE_BUY in decisions:
+        return _RETURN_CODE_BUY
+    return _RETURN_CODE_DO_NOT_BUY
+
+
+def buy_or_not_many(revolut, last_transactions, simulate,
+                    percent_margins=None, forceexchange=False):
+    """ Decide to buy or not for several pairs, in a single pass.
+    last_transactions is a dict {historyfile: last Transaction}, and
+    percent_margins an optional dict {historyfile: percent margin}.
+    All the quotes are fetched concurrently (Revolut.quote_many).
+    Returns a dict {historyfile: (decision, the exchange Transaction or None)}
+    , the decision being _RETURN_CODE_ERROR if its quote or exchange failed
+    """
+    percent_margins = percent_margins or {}
+    pairs = {filename: (last_tr.to_amount, last_tr.from_amount.currency)
+             for filename, last_tr in last_transactions.items()}
+    quotes = revolut.quote_many(pairs.values())
+
+    decisions = {}
+    for filename, last_tr in last_transactions.items():
+        quote = quotes[pairs[filename]]
+        try:
+            if isinstance(quote, Exception):
+                raise quote
+            decisions[filename] = buy_or_not(
+                        revolut=revolut,
+                        last_tr=last_tr,
+                        simulate=simulate,
+                        forceexchange=forceexchange,
+                        percent_margin=percent_margins.get(
+                            filename, _BOT_PERCENT_MARGIN),
+                        quote=quote)
+        except Exception:
+            logger.exception("Error while running the bot on %s", filename)
+            decisions[filename] = (_RETURN_CODE_ERROR, None)
+    return decisions
+
+
+def buy_or_not(revolut, last_tr, simulate, forceexchange=False,
+               percent_margin=_BOT_PERCENT_MARGIN, quote=None):
+    """ Decide to buy or not, from the last transaction of the history,
+    and exchange if needed (and not simulate).
+    quote is the current value of last_tr.to_amount in the previous
+    currency (fetched if None).
+    Returns (_RETURN_CODE_BUY or _RETURN_CODE_DO_NOT_BUY,
+    the exchange Transaction or None) """
     log()
     log("Last transaction : {}\n".format(last_tr))
     previous_currency = last_tr.from_amount.currency
 
     current_balance = last_tr.to_amount  # How much we currently have
 
-    current_balance_in_other_currency = revolut.quote(
-                                from_amount=current_balance,
-                                to_currency=previous_currency)
+    if quote is None:
+        quote = revolut.quote(from_amount=current_balance,
+                              to_currency=previous_currency)
+    current_balance_in_other_currency = quote
     log("Today : {} in {} : {}\n".format(
         current_balance, previous_currency, current_balance_in_other_currency))
 
@@ -106,6 +301,7 @@ def to_buy_or_not_to_buy(revolut, simulate, filename, forceexchange):
     buy_condition = current_balance_in_other_currency.real_amount > \
         last_sell_plus_margin.real_amount
 
+    exchange_transaction = None
     if buy_condition or forceexchange:
         if buy_condition:
             log("{} > {}".format(
@@ -123,17 +319,70 @@ def to_buy_or_not_to_buy(revolut, simulate, filename, forceexchange):
                             to_currency=previous_currency,
                             simulate=simulate)
             log("{} bought".format(exchange_transaction.to_amount.real_amount))
-            log("Update history file : {}".format(filename))
-            revolut_bot.update_historyfile(
-                                    filename=filename,
-                                    exchange_transaction=exchange_transaction)
-        sys.exit(_RETURN_CODE_BUY)
+        return _RETURN_CODE_BUY, exchange_transaction
     else:
         log("{} < {}".format(
             current_balance_in_other_currency,
             last_sell_plus_margin))
         log("=> DO NOT BUY")
-        sys.exit(_RETURN_CODE_DO_NOT_BUY)
+        return _RETURN_CODE_DO_NOT_BUY, exchange_transaction
+
+
+def run_daemon(revolut, simulate, bots, interval, statusfile=None,
+               stop_event=None):
+    """ Run the bot every interval seconds, until stop_event is set.
+    bots is a list of (historyfile, percent_margin).
+    The session and the last transactions are kept in memory between runs.
+    The decisions are logged, and written to statusfile (json) if set """
+    stop_event = stop_event or threading.Event()
+    percent_margins = dict(bots)
+    last_transactions = {filename: get_last_transaction(filename)
+                         for filename, _ in bots}
+    for filename, last_tr in last_transactions.items():
+        logger.info("Bot started (every %s s), last transaction of %s : %s",
+                    interval, filename, last_tr)
+
+    while not stop_event.is_set():
+        try:
+            decisions = buy_or_not_many(
+                                revolut=revolut,
+                                last_transactions=last_transactions,
+                                simulate=simulate,
+                                percent_margins=percent_margins)
+        except Exception:
+            logger.exception("Error while running the bot")
+            decisions = {filename: (_RETURN_CODE_ERROR, None)
+                         for filename in last_transactions}
+
+        status = {"date": datetime.now().isoformat(), "bots": {}}
+        for filename, (decision, exchange_transaction) in decisions.items():
+            if exchange_transaction is not None:
+                try:
+                    update_history(filename, exchange_transaction)
+                except Exception:
+                    logger.exception("Error while updating %s", filename)
+                last_transactions[filename] = exchange_transaction
+            logger.info("Decision for %s : %s",
+                        filename, _DECISION_NAMES[decision])
+            status["bots"][filename] = {
+                "decision": _DECISION_NAMES[decision],
+                "last_transaction": str(last_transactions[filename]),
+                "exchange_transaction": None if exchange_transaction is None
+                else str(exchange_transaction),
+            }
+        if statusfile:
+            write_status_file(statusfile, status)
+        stop_event.wait(interval)
+    logger.info("Bot stopped")
+
+
+def write_status_file(filename, status):
+    """ Write the status as json, atomically """
+    import json
+    tmp_filename = "{}.tmp".format(filename)
+    with open(tmp_filename, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp_filename, filename)
 
 
 if __name__ == "__main__":
@@ -37,6 +37,7 @@ setup(
     keywords=_MOTS_CLES,
     setup_requires=requirements,
     install_requires=requirements,
+    extras_require={'analytics': ['numpy'], 'fastjson': ['orjson']},
     classifiers=['Programming Language :: Python :: 3'],
     python_requires='>=3',
     tests_require=['pytest'],
@@ -1,5 +1,21 @@
 from revolut import Amount, Accounts, Account, Transaction, Revolut, Client
+from revolut import QuoteCache, AccountTransaction, AccountTransactions
+from revolut import write_transactions_csv, write_transactions_ndjson
+from revolut import JsonBackend
+from revolut import RetryPolicy, RateLimiter
 from revolut import get_token_step1, get_token_step2
+from revolut.aio import AsyncRevolut
+from revolut.store import TransactionStore, sync_account_transactions
+from revolut.mock_server import MockRevolutServer
+from revolut.metrics import MetricsRegistry
+from revolut.rates import RateMatrix
+import asyncio
+import io
+import json
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
 import pytest
 import os
 
@@ -29,6 +45,56 @@ assert _TOKEN
 revolut = Revolut(token=_TOKEN, device_id=_DEVICE_ID)
 
 
+class _FakeResponse:
+    def __init__(self, json_obj):
+        self.content = json.dumps(json_obj).encode("utf-8")
+
+
+class _FakeTransactionsClient(Client):
+    """ Serve transactions pages like /user/current/transactions/last """
+    def __init__(self, raw_transactions, page_size=2):
+        Client.__init__(self, token="fake_token", device_id="fake_id")
+        self.raw_transactions = raw_transactions
+        self.page_size = page_size
+        self.calls = 0
+
+    def _get(self, url, params=None, **kwargs):
+        self.calls += 1
+        params = params or {}
+        page = [tr for tr in sorted(self.raw_transactions,
+                                    key=lambda tr: -tr["startedDate"])
+                if tr["startedDate"] < params.get("to", float("inf"))
+                and tr["startedDate"] >= params.get("from", 0)]
+        return _FakeResponse(page[:self.page_size])
+
+
+class _FakeWalletClient(Client):
+    """ Serve /user/current/wallet and /exchange """
+    def __init__(self):
+        Client.__init__(self, token="fake_token", device_id="fake_id")
+        self.calls = 0
+
+    def _get(self, url, **kwargs):
+        self.calls += 1
+        return _FakeResponse({"id": "wallet_id", "pockets": [
+            {"balance": 10000, "currency": "EUR", "type": "CURRENT",
+             "state": "ACTIVE"}]})
+
+    def _post(self, url, **kwargs):
+        exchange = [{"state": "COMPLETED",
+                     "counterpart": {"amount": 170, "currency": "BTC"}}]
+        return _FakeResponse(exchange)
+
+
+def _build_raw_transaction(tr_id, started_date, state="COMPLETED",
+                           amount=-1000, currency="EUR"):
+    return {"id": tr_id, "type": "CARD_PAYMENT", "state": state,
+            "startedDate": started_date, "completedDate": started_date,
+            "amount": amount, "fee": 0, "currency": currency,
+            "description": "Payment {}".format(tr_id),
+            "account": {"id": "account_id"}}
+
+
 def test_class_Amount():
     amount = Amount(revolut_amount=100, currency="EUR")
     assert amount.real_amount == 1
@@ -42,6 +108,11 @@ def test_class_Amount():
     assert amount.real_amount == 1
     assert str(amount) == "1.00000000 BTC"
 
+    amount = Amount(real_amount=0.29, currency="EUR")
+    assert amount.real_amount == 0.29  # As given, not derived
+    assert amount.real_amount_str == "0.29"
+    assert not hasattr(amount, "__dict__")
+
 
 def test_class_Amount_errors():
     with pytest.raises(KeyError):
@@ -94,6 +165,240 @@ def test_quote_commission():
     assert comm_rate < 0.05
 
 
+def test_wallet_cache():
+    offline_revolut = Revolut(token=_TOKEN, device_id=_DEVICE_ID,
+                              wallet_ttl=60)
+    offline_revolut.client = _FakeWalletClient()
+    assert len(offline_revolut.get_account_balances()) == 1
+    offline_revolut.get_account_balances()
+    assert offline_revolut.get_wallet_id() == "wallet_id"
+    assert offline_revolut.client.calls == 1
+
+    offline_revolut.exchange(from_amount=Amount(real_amount=1,
+                                                currency="EUR"),
+                             to_currency="BTC")
+    offline_revolut.get_account_balances()
+    assert offline_revolut.client.calls == 2
+    offline_revolut.get_wallet(refresh=True)
+    assert offline_revolut.client.calls == 3
+    offline_revolut.invalidate_wallet()
+    offline_revolut.get_wallet_id()
+    assert offline_revolut.client.calls == 4
+
+    offline_revolut.wallet_ttl = 0
+    offline_revolut.get_wallet_id()
+    offline_revolut.get_wallet_id()
+    assert offline_revolut.client.calls == 6
+
+
+class _FakeQuoteRevolut:
+    """ Quote with fixed rates in EUR, without network """
+    _RATES = {"USD": 0.8, "BTC": 10000, "GBP": 1.1}
+
+    def __init__(self):
+        self.quotes = []
+
+    def quote(self, from_amount, to_currency, use_cache=True):
+        self.quotes.append(from_amount.currency)
+        return Amount(
+            real_amount=from_amount.real_amount *
+            self._RATES[from_amount.currency], currency=to_currency)
+
+
+def test_accounts_total_value():
+    accounts = Accounts([
+        {"type": "CURRENT", "state": "ACTIVE", "currency": "EUR",
+         "balance": 10000},
+        {"type": "CURRENT", "state": "ACTIVE", "currency": "USD",
+         "balance": 10000},
+        {"type": "SAVINGS", "state": "ACTIVE", "currency": "USD",
+         "balance": 30000, "vault_name": "My vault"},
+        {"type": "CURRENT", "state": "ACTIVE", "currency": "BTC",
+         "balance": 1000000},
+        {"type": "CURRENT", "state": "INACTIVE", "currency": "GBP",
+         "balance": 10000},
+        {"type": "CURRENT", "state": "ACTIVE", "currency": "GBP",
+         "balance": 0},
+    ])
+    fake_revolut = _FakeQuoteRevolut()
+    valuation = accounts.total_value("EUR", fake_revolut)
+    # One quote per currency (none for EUR, nor the empty GBP balance)
+    assert sorted(fake_revolut.quotes) == ["BTC", "USD"]
+
+    # 100 EUR + 400 USD * 0.8 + 0.01 BTC * 10000
+    assert str(valuation.total) == "520.00 EUR"
+    usd = valuation.currencies["USD"]
+    assert str(usd.balance) == "400.00 USD"
+    assert str(usd.value) == "320.00 EUR"
+    assert usd.rate == 0.8
+    assert type(usd.quote_date) == datetime
+    assert valuation.currencies["EUR"].quote_date is None
+    assert str(valuation.currencies["GBP"].value) == "0.00 EUR"
+    assert [(account.name, str(value))
+            for account, value in valuation.accounts] == [
+        ("EUR CURRENT", "100.00 EUR"),
+        ("USD CURRENT", "80.00 EUR"),
+        ("USD SAVINGS (My vault)", "240.00 EUR"),
+        ("BTC CURRENT", "100.00 EUR"),
+        ("GBP CURRENT", "0.00 EUR"),
+    ]
+    assert str(valuation).endswith("Total : 520.00 EUR")
+
+    # Accounts of a currency offsetting each other keep their own value
+    accounts = Accounts([
+        {"type": "CURRENT", "state": "ACTIVE", "currency": "USD",
+         "balance": 10000},
+        {"type": "SAVINGS", "state": "ACTIVE", "currency": "USD",
+         "balance": -10000, "vault_name": "My vault"},
+    ])
+    valuation = accounts.total_value("EUR", _FakeQuoteRevolut())
+    assert [str(value) for account, value in valuation.accounts] == \
+        ["80.00 EUR", "-80.00 EUR"]
+    assert str(valuation.total) == "0.00 EUR"
+    assert valuation.currencies["USD"].rate == 0.8
+
+
+def test_rate_matrix():
+    # Value of 1 unit in EUR
+    rates_in_eur = {"EUR": 1, "USD": 0.8, "GBP": 1.25, "BTC": 10000,
+                    "JPY": 0.008}
+
+    class _FakeRevolut:
+        def __init__(self):
+            self.pairs = []
+
+        def quote_many(self, pairs, max_concurrency):
+            self.pairs.extend((amount.currency, to_currency)
+                              for amount, to_currency in pairs)
+            return {(amount, to_currency): Amount(
+                real_amount=amount.real_amount *
+                rates_in_eur[amount.currency] / rates_in_eur[to_currency],
+                currency=to_currency)
+                for amount, to_currency in pairs}
+
+    fake_revolut = _FakeRevolut()
+    matrix = RateMatrix(fake_revolut, ["USD", "GBP", "BTC", "JPY"],
+                        pivots=["EUR"], max_age=3600)
+    assert matrix.currencies == ["USD", "GBP", "BTC", "JPY", "EUR"]
+    assert matrix.get_rate("USD", "EUR") == 0.8
+    # Only the legs from the pivot were quoted
+    assert sorted(fake_revolut.pairs) == [
+        ("EUR", "BTC"), ("EUR", "GBP"), ("EUR", "JPY"), ("EUR", "USD")]
+    assert not matrix.is_derived("EUR", "USD")
+    assert matrix.is_derived("USD", "EUR")
+    assert matrix.get_rate("EUR", "USD") == 1 / 0.8
+    assert matrix.is_derived("GBP", "USD")
+    assert round(matrix.get_rate("GBP", "USD"), 6) == 1.5625
+    assert round(matrix.get_rate("BTC", "JPY")) == 1250000
+    assert matrix.get_rate("JPY", "JPY") == 1
+    assert str(matrix.convert(Amount(real_amount=100, currency="GBP"),
+                              "USD")) == "156.25 USD"
+    assert len(fake_revolut.pairs) == 4  # Not refreshed yet
+
+    matrix.max_age = 0
+    matrix.get_rate("USD", "GBP")
+    assert len(fake_revolut.pairs) == 8
+
+    matrix = RateMatrix(fake_revolut, ["USD", "GBP"], pivots=["EUR", "USD"],
+                        auto_refresh=False)
+    with pytest.raises(ValueError):
+        matrix.get_rate("USD", "GBP")
+    matrix.refresh()
+    assert not matrix.is_derived("EUR", "USD")
+    assert not matrix.is_derived("USD", "GBP")
+    assert matrix.is_derived("GBP", "USD")
+
+    # A currency worth little is quoted precisely (1000 EUR in IDR)
+    with MockRevolutServer() as server:
+        mock_revolut = Revolut(token="token", device_id="device_id",
+                               api_base=server.api_base)
+        matrix = RateMatrix(mock_revolut, ["IDR", "BTC", "USD"])
+        assert abs(matrix.get_rate("IDR", "EUR") / 0.0000575 - 1) < 1e-6
+        assert abs(matrix.get_rate("BTC", "IDR") /
+                   (30000 / 0.0000575) - 1) < 1e-6
+
+
+def test_quote_many():
+    eur = Amount(real_amount=100, currency="EUR")
+    btc = Amount(real_amount=1, currency="BTC")
+    pairs = [(eur, "USD"), (eur, "BTC"), (btc, "EUR"), (eur, "UNKNOWN")]
+    quotes = revolut.quote_many(pairs, max_concurrency=2)
+    assert list(quotes) == pairs
+    assert type(quotes[(eur, "UNKNOWN")]) == KeyError
+    for pair in pairs[:-1]:
+        assert type(quotes[pair]) == Amount
+        assert quotes[pair].currency == pair[1]
+
+
+def test_quote_many_mock_server():
+    eur = Amount(real_amount=100, currency="EUR")
+    btc = Amount(real_amount=1, currency="BTC")
+    currencies = ["USD", "GBP", "CHF", "JPY", "SEK"]
+    pairs = [(eur, c) for c in currencies] + [(btc, "EUR"), (eur, "UNKNOWN")]
+    # Equal amounts, as other objects : quoted once
+    pairs += [(Amount(revolut_amount=10000, currency="EUR"), c)
+              for c in currencies]
+
+    with MockRevolutServer(latency=0.05) as server:
+        mock_revolut = Revolut(token="token", device_id="device_id",
+                               api_base=server.api_base)
+        start = time.monotonic()
+        quotes = mock_revolut.quote_many(pairs, max_concurrency=6)
+        elapsed = time.monotonic() - start
+        assert server.request_count == 6  # The unknown currency is not sent
+
+        # The connection pool grows with the concurrency
+        mock_revolut.quote_many(pairs, max_concurrency=20)
+        adapter = mock_revolut.client.session.get_adapter(server.api_base)
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] == 20
+
+    assert len(quotes) == 7
+    assert elapsed < 6 * 0.05  # In parallel
+    assert str(quotes[(eur, "USD")]) == "111.11 USD"
+    assert str(quotes[(Amount(real_amount=100, currency="EUR"),
+                       "USD")]) == "111.11 USD"
+    assert str(quotes[(btc, "EUR")]) == "30000.00 EUR"
+    assert type(quotes[(eur, "UNKNOWN")]) == KeyError
+
+
+def test_class_QuoteCache():
+    eur_100 = Amount(real_amount=100, currency="EUR")
+    eur_50 = Amount(real_amount=50, currency="EUR")
+    usd_110 = Amount(real_amount=110, currency="USD")
+
+    cache = QuoteCache(max_size=2)
+    assert cache.get(eur_100, "USD") is None
+    cache.set(eur_100, "USD", usd_110)
+    assert cache.get(eur_100, "USD").revolut_amount == 11000
+    assert cache.get(eur_50, "USD") is None  # No scaling by default
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache.set(eur_100, "GBP", Amount(real_amount=90, currency="GBP"))
+    cache.set(eur_100, "BTC", Amount(real_amount=0.01, currency="BTC"))
+    assert len(cache) == 2
+    assert cache.get(eur_100, "USD") is None  # Evicted (LRU)
+
+    cache = QuoteCache(pair_ttl={("EUR", "USD"): 0}, scale_amount=True)
+    cache.set(eur_100, "USD", usd_110)
+    cache.set(eur_100, "GBP", Amount(real_amount=90, currency="GBP"))
+    assert cache.get(eur_100, "USD") is None  # Expired
+    assert str(cache.get(eur_50, "GBP")) == "45.00 GBP"
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_quote_cache():
+    cached_revolut = Revolut(token=_TOKEN, device_id=_DEVICE_ID,
+                             quote_cache=QuoteCache(ttl=60))
+    eur = Amount(real_amount=100, currency="EUR")
+    first_quote = cached_revolut.quote(from_amount=eur, to_currency="USD")
+    second_quote = cached_revolut.quote(from_amount=eur, to_currency="USD")
+    assert second_quote.revolut_amount == first_quote.revolut_amount
+    assert cached_revolut.quote_cache.hits == 1
+    cached_revolut.quote(from_amount=eur, to_currency="USD", use_cache=False)
+    assert cached_revolut.quote_cache.hits == 1
+
+
 def test_quote_errors():
     with pytest.raises(TypeError):
         revolut.quote(from_amount="100 EUR", to_currency="EUR")
@@ -149,6 +454,79 @@ def test_exchange_errors():
         revolut.exchange(from_amount=ten_thousands_euros, to_currency="EUR")
 
 
+def test_async_revolut():
+    async def run(async_revolut):
+        eur_to_btc = Amount(real_amount=0.01, currency="EUR")
+        exchange_transaction = await async_revolut.exchange(
+                                        from_amount=eur_to_btc,
+                                        to_currency="BTC",
+                                        simulate=True)
+        assert type(exchange_transaction) == Transaction
+
+        with pytest.raises(KeyError):
+            await async_revolut.quote(from_amount=eur_to_btc,
+                                      to_currency="UNKNOWN")
+
+        accounts, *quotes = await asyncio.gather(
+            async_revolut.get_account_balances(),
+            *[async_revolut.quote(from_amount=eur_to_btc, to_currency=c)
+              for c in ["BTC", "USD", "GBP"]])
+        assert len(accounts) > 0
+        for quote in quotes:
+            assert type(quote) == Amount
+
+    async_revolut = AsyncRevolut(token=_TOKEN, device_id=_DEVICE_ID)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run(async_revolut))
+    finally:
+        loop.close()
+        async_revolut.close()
+
+
+def test_async_revolut_mock_server():
+    async def run(async_revolut):
+        eur = Amount(real_amount=100, currency="EUR")
+        currencies = ["USD", "GBP", "BTC", "CHF"] * 10
+        accounts, *quotes = await asyncio.gather(
+            async_revolut.get_account_balances(),
+            *[async_revolut.quote(from_amount=eur, to_currency=c)
+              for c in currencies])
+        assert len(accounts) == 3
+        assert [quote.currency for quote in quotes] == currencies
+        assert str(quotes[0]) == "111.11 USD"
+
+        with pytest.raises(KeyError):
+            await async_revolut.quote(from_amount=eur, to_currency="UNKNOWN")
+
+        account_transactions = await async_revolut.get_account_transactions()
+        assert len(account_transactions) == 120
+
+        # The wallet snapshot is shared, and dropped after an exchange
+        assert await async_revolut.get_wallet_id() == "wallet_id"
+        usd_balance = accounts.get_account_by_name("USD CURRENT").balance
+        await async_revolut.exchange(from_amount=eur, to_currency="USD")
+        new_accounts = await async_revolut.get_account_balances()
+        new_usd_balance = new_accounts.get_account_by_name(
+            "USD CURRENT").balance
+        assert new_usd_balance.revolut_amount == \
+            usd_balance.revolut_amount + 11111
+
+    with MockRevolutServer(transactions=120, pockets=3,
+                           latency=0.01) as server:
+        async_revolut = AsyncRevolut(token="token", device_id="device_id",
+                                     max_concurrency=20,
+                                     api_base=server.api_base)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run(async_revolut))
+        finally:
+            loop.close()
+            async_revolut.close()
+        # 3 pages + an empty one, then the exchange and the new wallet
+        assert server.request_count == 1 + 40 + 4 + 2
+
+
 def test_class_account():
     account = Account(account_type="CURRENT",
                       balance=Amount(real_amount=200.85, currency="EUR"),
@@ -206,6 +584,114 @@ EUR SAVINGS (My vault),10.00,EUR"
     assert account is None
 
 
+def test_class_JsonBackend():
+    obj = {"a": [1, 2.5, None], "b": "é"}
+    for name in ["json", None]:
+        json_backend = JsonBackend(name)
+        assert json_backend.loads(json_backend.dumps(obj)) == obj
+        assert json_backend.loads(json.dumps(obj).encode("utf-8")) == obj
+    assert JsonBackend("json").name == "json"
+
+    with pytest.raises(ImportError):
+        JsonBackend("unknown_json_module")
+
+    c = Client(device_id="unknown", token="unknown", json_backend="json")
+    assert c.json_backend.name == "json"
+
+
+class _FakeSession:
+    """ Return the given (status_code, headers) responses, in order """
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(method)
+        status_code, headers = self.responses.pop(0)
+        response = _FakeResponse({"status": status_code})
+        response.status_code = status_code
+        response.headers = headers
+        response.text = str(status_code)
+        return response
+
+
+def test_client_retry():
+    retry_policy = RetryPolicy(max_retries=2, backoff_factor=0)
+    c = Client(device_id="unknown", token="unknown",
+               retry_policy=retry_policy)
+
+    c.session = _FakeSession([(503, {}), (429, {"Retry-After": "0"}),
+                              (200, {})])
+    assert c._decode(c._get("https://api.revolut.com/page")) == \
+        {"status": 200}
+    assert len(c.session.calls) == 3
+
+    c.session = _FakeSession([(500, {})] * 3)
+    with pytest.raises(ConnectionError):
+        c._get("https://api.revolut.com/page")
+    assert len(c.session.calls) == 3  # max_retries + 1
+
+    c.session = _FakeSession([(404, {})])
+    with pytest.raises(ConnectionError):
+        c._get("https://api.revolut.com/page")
+
+    # A POST is not retried on server errors (it may have been processed)
+    c.session = _FakeSession([(500, {}), (200, {})])
+    with pytest.raises(ConnectionError):
+        c._post("https://api.revolut.com/page", json={})
+    c.session = _FakeSession([(429, {}), (200, {})])
+    c._post("https://api.revolut.com/page", json={})
+    assert c.session.calls == ["POST", "POST"]
+
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+    for attempt in range(10):
+        assert 0 <= policy.get_backoff(attempt) <= 5
+    response = _FakeResponse({})
+    response.headers = {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert policy.get_delay(0, response) == 0  # Date in the past
+    response.headers = {"Retry-After": "3"}
+    assert policy.get_delay(0, response) == 3
+    response.headers = {"Retry-After": "3600"}
+    with pytest.raises(ConnectionError):
+        policy.get_delay(0, response)  # Above max_backoff
+
+    # Not retried when the server asks to wait longer than max_backoff
+    c = Client(device_id="unknown", token="unknown", retry_policy=policy)
+    c.session = _FakeSession([(429, {"Retry-After": "3600"}), (200, {})])
+    with pytest.raises(ConnectionError):
+        c._get("https://api.revolut.com/page")
+    assert c.session.calls == ["GET"]
+
+
+def test_class_RateLimiter():
+    limiter = RateLimiter(rate=50, burst=5)
+    start = time.monotonic()
+    for _ in range(10):
+        limiter.acquire()
+    # 5 requests in the burst, then 5 more at 50 requests per second
+    assert 0.08 <= time.monotonic() - start < 0.5
+
+    limiter = RateLimiter(rate=1000, burst=5)
+    start = time.monotonic()
+    limiter.pause(0.1)
+    assert limiter.acquire() > 0.09
+    assert 0.1 <= time.monotonic() - start < 0.5
+
+    # A 429 response pauses every request sharing the limiter
+    c = Client(device_id="unknown", token="unknown", rate_limiter=limiter,
+               retry_policy=RetryPolicy(max_retries=1))
+    c.session = _FakeSession([(429, {"Retry-After": "0.2"}), (200, {})])
+    thread = threading.Thread(target=c._get,
+                              args=("https://api.revolut.com/page",))
+    start = time.monotonic()
+    thread.start()
+    time.sleep(0.05)
+    limiter.acquire()  # Another caller
+    assert time.monotonic() - start >= 0.2
+    thread.join()
+    assert c.session.calls == ["GET", "GET"]
+
+
 def test_client_errors():
     with pytest.raises(ConnectionError):
         c = Client(device_id="unknown", token="unknown")
@@ -247,3 +733,334 @@ def test_get_token(capsys):
         for account in accounts:
             assert type(account) == Amount
             print('{}'.format(account))
+
+
+def test_sync_account_transactions():
+    day = 24 * 3600 * 1000
+    now = int(datetime.now().timestamp()) * 1000
+    raw_transactions = [_build_raw_transaction(str(i), now - i * day)
+                        for i in range(20, 0, -1)]
+    raw_transactions[-1]["state"] = "PENDING"
+    fake_client = _FakeTransactionsClient(raw_transactions, page_size=10)
+    offline_revolut = Revolut(token=_TOKEN, device_id=_DEVICE_ID)
+    offline_revolut.client = fake_client
+
+    store = TransactionStore(":memory:")
+    count = sync_account_transactions(offline_revolut, store)
+    assert count == len(store) == 20
+    assert fake_client.calls == 3
+
+    # A new transaction, and the pending one is now completed
+    raw_transactions[-1] = dict(raw_transactions[-1], state="COMPLETED")
+    raw_transactions.append(_build_raw_transaction("0", now))
+    fake_client.calls = 0
+    count = sync_account_transactions(offline_revolut, store)
+    assert fake_client.calls == 2
+    assert count == 5  # 1 new + 4 in the recheck window
+    assert len(store) == 21
+
+    account_transactions = store.get_account_transactions(
+        from_date=datetime.fromtimestamp((now - 3 * day) / 1000))
+    assert len(account_transactions) == 4
+    assert [tr.state for tr in account_transactions.list] == \
+        ["COMPLETED"] * 4
+
+    # A transaction still pending long before the recheck window
+    pending_transaction = dict(raw_transactions[12], state="PENDING")
+    assert pending_transaction["startedDate"] == now - 8 * day
+    store.upsert([pending_transaction])
+    count = sync_account_transactions(offline_revolut, store)
+    assert count == 9  # Downloaded again from the pending one
+    assert store.get_oldest_pending_date() is None
+    store.close()
+
+
+def test_sync_account_transactions_backfill():
+    day = 24 * 3600 * 1000
+    now = int(datetime.now().timestamp()) * 1000
+    raw_transactions = [_build_raw_transaction(str(i), now - i * day)
+                        for i in range(20, 0, -1)]
+    fake_client = _FakeTransactionsClient(raw_transactions, page_size=10)
+    offline_revolut = Revolut(token=_TOKEN, device_id=_DEVICE_ID)
+    offline_revolut.client = fake_client
+
+    store = TransactionStore(":memory:")
+    ten_days_ago = datetime.fromtimestamp((now - 10 * day - 1) / 1000)
+    assert sync_account_transactions(offline_revolut, store,
+                                     from_date=ten_days_ago) == 10
+    assert store.get_synced_from() == int(ten_days_ago.timestamp()) * 1000
+
+    # An earlier start : the days before the synced period are downloaded
+    fifteen_days_ago = datetime.fromtimestamp((now - 15 * day - 1) / 1000)
+    count = sync_account_transactions(offline_revolut, store,
+                                      from_date=fifteen_days_ago)
+    assert count == 5 + 4  # 5 older + 4 in the recheck window
+    assert len(store) == 15
+    assert len(store.get_account_transactions(
+        from_date=fifteen_days_ago)) == 15
+
+    # The whole history
+    sync_account_transactions(offline_revolut, store)
+    assert len(store) == 20
+    assert store.get_synced_from() == 0
+
+    # Nothing more to backfill
+    fake_client.calls = 0
+    assert sync_account_transactions(offline_revolut, store,
+                                     from_date=ten_days_ago) == 4
+    assert fake_client.calls == 2  # The recheck window only
+    store.close()
+
+
+def test_iter_account_transactions():
+    raw_transactions = [_build_raw_transaction(str(i), 1000 * i)
+                        for i in range(1, 8)]
+    offline_revolut = Revolut(token=_TOKEN, device_id=_DEVICE_ID)
+    offline_revolut.client = _FakeTransactionsClient(raw_transactions,
+                                                     page_size=3)
+
+    transactions = offline_revolut.iter_account_transactions()
+    first_transaction = next(transactions)
+    assert type(first_transaction) == AccountTransaction
+    assert first_transaction.started_date == 7000
+    assert offline_revolut.client.calls == 1  # Lazy
+    assert len(list(transactions)) == 6
+
+    pages = list(offline_revolut.iter_account_transactions(pages=True))
+    assert [len(page) for page in pages] == [3, 3, 1]
+    account_transactions = AccountTransactions.from_pages(pages)
+    assert len(account_transactions) == 7
+    assert len(account_transactions.raw_list) == 7
+    assert account_transactions[-1].started_date == 1000
+
+    account_transactions = offline_revolut.get_account_transactions()
+    assert [tr.started_date for tr in account_transactions] == \
+        [1000 * i for i in range(7, 0, -1)]
+
+    raw = list(offline_revolut.iter_account_transactions(raw=True))
+    assert raw == raw_transactions[::-1]
+
+
+def test_write_transactions_ndjson():
+    raw_transactions = [_build_raw_transaction(str(i), 1000 * i)
+                        for i in range(1, 8)]
+    offline_revolut = Revolut(token=_TOKEN, device_id=_DEVICE_ID)
+    offline_revolut.client = _FakeTransactionsClient(raw_transactions,
+                                                     page_size=3)
+
+    class _Output(io.StringIO):
+        """ Record the number of pages downloaded at each flush """
+        def __init__(self):
+            super().__init__()
+            self.flushes = []
+
+        def flush(self):
+            self.flushes.append(offline_revolut.client.calls)
+
+    output = _Output()
+    write_transactions_ndjson(
+        output,
+        offline_revolut.iter_account_transactions(pages=True, raw=True),
+        json_backend="json")
+    lines = output.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == raw_transactions[::-1]
+    assert output.flushes == [1, 2, 3]  # Each page written when received
+
+
+def test_class_account_transactions_csv():
+    raw_transactions = [
+        _build_raw_transaction("1", 1546300800000, amount=-1050,
+                               currency="EUR"),
+        _build_raw_transaction("2", 1546387200000, state="DECLINED"),
+        _build_raw_transaction("3", 1546473600000, state="PENDING",
+                               amount=20000, currency="USD"),
+    ]
+    raw_transactions[0]["description"] = "Amazon.fr"
+    account_transactions = AccountTransactions(raw_transactions)
+
+    csv_fr = account_transactions.csv(lang="fr")
+    lines = csv_fr.split("\n")
+    assert len(lines) == 3
+    assert lines[0] == \
+        "Date-heure (DD/MM/YYYY HH:MM:ss);Description;Montant;Devise"
+    assert lines[1].endswith(";Amazon.fr;-10,5;EUR")
+    assert lines[2].endswith(";Payment 3 **pending**;200,0;USD")
+
+    csv_en = account_transactions.csv(lang="en", reverse=True)
+    lines = csv_en.split("\n")
+    assert lines[1].endswith(",Payment 3 **pending**,200.0,USD")
+    assert lines[2].endswith(",Amazon.fr,-10.5,EUR")
+
+    csv_io = io.StringIO()
+    write_transactions_csv(csv_io, iter(account_transactions), lang="en")
+    assert csv_io.getvalue() == account_transactions.csv(lang="en") + "\n"
+
+
+def test_account_transactions_query():
+    raw_transactions = [
+        _build_raw_transaction("1", 1000, amount=-1050, currency="EUR"),
+        _build_raw_transaction("2", 2000, state="DECLINED", amount=-500),
+        _build_raw_transaction("3", 3000, state="PENDING",
+                               amount=20000, currency="USD"),
+        _build_raw_transaction("4", 4000, amount=300, currency="EUR"),
+    ][::-1]  # The most recent first, like the API
+    raw_transactions[1]["completedDate"] = None
+    raw_transactions[0]["account"]["id"] = "other_account_id"
+    account_transactions = AccountTransactions(raw_transactions)
+
+    query = account_transactions.where(currency="EUR")
+    assert [tr.started_date for tr in query] == [4000, 2000, 1000]
+    query = query.where(state=["COMPLETED", "PENDING"])
+    assert [tr.started_date for tr in query] == [4000, 1000]
+    assert [tr.started_date for tr in query.between(
+        from_date=1000, to_date=4000)] == [1000]
+    assert [tr.started_date for tr in account_transactions.between(
+        datetime.fromtimestamp(2), datetime.fromtimestamp(4))] == \
+        [3000, 2000]
+    # The pending transaction is not completed yet
+    assert [tr.started_date for tr in account_transactions.between(
+        from_date=0, column="completed_date")] == [4000, 2000, 1000]
+    assert len(account_transactions.where(currency="GBP")) == 0
+    assert len(account_transactions.where(currency="GBP").between()) == 0
+    with pytest.raises(KeyError):
+        account_transactions.where(amount=300)
+
+    groups = account_transactions.where(state="COMPLETED").group_by(
+        "account_id")
+    assert {account_id: len(group) for account_id, group
+            in groups.items()} == {"account_id": 1, "other_account_id": 1}
+
+    selection = query.to_account_transactions()
+    assert type(selection) == AccountTransactions
+    assert selection.raw_list == [raw_transactions[0], raw_transactions[3]]
+    assert len(selection.where(state="COMPLETED")) == 2
+
+
+def test_transaction_table():
+    np = pytest.importorskip("numpy")
+    raw_transactions = [
+        _build_raw_transaction("1", 1000, amount=-1050, currency="EUR"),
+        _build_raw_transaction("2", 2000, state="DECLINED", amount=-500),
+        _build_raw_transaction("3", 3000, state="PENDING",
+                               amount=20000, currency="USD"),
+        _build_raw_transaction("4", 4000, amount=300, currency="EUR"),
+    ]
+    raw_transactions[2]["completedDate"] = None
+    raw_transactions[3]["account"]["id"] = "other_account_id"
+    table = AccountTransactions(raw_transactions).to_columns()
+    assert len(table) == 4
+    assert table["amount"].dtype == np.int64
+    assert list(table["state"]) == ["COMPLETED", "DECLINED",
+                                    "PENDING", "COMPLETED"]
+    assert table["completed_date"][2] == -1
+
+    completed = table.filter(state="COMPLETED")
+    assert list(completed["started_date"]) == [1000, 4000]
+    assert len(table.filter(state=["COMPLETED", "PENDING"],
+                            account_id="account_id")) == 2
+    assert len(table.filter(currency="GBP")) == 0
+    with pytest.raises(KeyError):
+        table.filter(unknown="value")
+
+    assert list(table.between(2000, 4000)["started_date"]) == [2000, 3000]
+    assert len(table.between(from_date=datetime.fromtimestamp(3))) == 2
+
+    sums = table.sum_by_currency()
+    assert sums["EUR"].revolut_amount == -1250
+    assert sums["USD"].revolut_amount == 20000
+    assert set(table.filter(currency="USD").sum_by_currency()) == {"USD"}
+
+
+def test_get_account_transactions_by_windows():
+    day = 24 * 3600 * 1000
+    now = int(datetime.now().timestamp()) * 1000
+    raw_transactions = [_build_raw_transaction(str(i), now - i * day // 2)
+                        for i in range(1, 60)]
+    offline_revolut = Revolut(token=_TOKEN, device_id=_DEVICE_ID)
+    offline_revolut.client = _FakeTransactionsClient(raw_transactions,
+                                                     page_size=5)
+    from_date = datetime.fromtimestamp((now - 40 * day) / 1000)
+    to_date = datetime.fromtimestamp(now / 1000)
+
+    serial = offline_revolut.get_account_transactions(from_date=from_date,
+                                                      to_date=to_date)
+    parallel = offline_revolut.get_account_transactions(
+        from_date=from_date, to_date=to_date,
+        max_workers=4, window=timedelta(days=7))
+    assert len(parallel) == len(serial) == 59
+    assert [tr["id"] for tr in parallel.raw_list] == \
+        [tr["id"] for tr in serial.raw_list]
+
+
+def test_mock_server():
+    with MockRevolutServer(transactions=500, page_size=40, pockets=3,
+                           error_rate=0.1, throttle_rate=0.1) as server:
+        mock_revolut = Revolut(token="token", device_id="device_id",
+                               api_base=server.api_base,
+                               retry_policy=RetryPolicy(max_retries=20,
+                                                        backoff_factor=0))
+        accounts = mock_revolut.get_account_balances()
+        assert len(accounts) == 3
+        assert mock_revolut.get_wallet_id() == "wallet_id"
+
+        account_transactions = mock_revolut.get_account_transactions()
+        assert len(account_transactions) == 500
+        dates = [tr.started_date for tr in account_transactions]
+        assert dates == sorted(dates, reverse=True)
+
+        from_date = datetime.fromtimestamp(
+            (server.get_started_date(450) - 1) / 1000)
+        assert len(mock_revolut.get_account_transactions(
+            from_date=from_date)) == 50
+
+        eur = Amount(real_amount=100, currency="EUR")
+        quote = mock_revolut.quote(from_amount=eur, to_currency="USD")
+        assert str(quote) == "111.11 USD"
+
+        server.error_rate = 0  # A POST is not retried on 500
+        usd_balance = accounts.get_account_by_name("USD CURRENT").balance
+        exchange_transaction = mock_revolut.exchange(
+            from_amount=Amount(real_amount=1, currency="USD"),
+            to_currency="EUR")
+        assert str(exchange_transaction.to_amount) == "0.90 EUR"
+        new_usd_balance = mock_revolut.get_account_balances()\
+            .get_account_by_name("USD CURRENT").balance
+        assert new_usd_balance.revolut_amount == \
+            usd_balance.revolut_amount - 100
+
+        with pytest.raises(ConnectionError):
+            mock_revolut.exchange(
+                from_amount=Amount(real_amount=1, currency="USD"),
+                to_currency="USD")
+
+        assert get_token_step1(device_id="cli", phone=_PHONE,
+                               password=_PASSWORD,
+                               api_base=server.api_base) == "SMS"
+
+
+def test_metrics_registry():
+    metrics = MetricsRegistry(latency_buckets=(0.5, 60))
+    c = Client(device_id="unknown", token="unknown", hooks=[metrics],
+               retry_policy=RetryPolicy(max_retries=2, backoff_factor=0))
+    c.session = _FakeSession([(503, {}), (200, {}), (200, {}), (404, {})])
+    c._get("/quote/EURUSD?amount=100&side=SELL")
+    c._get("/quote/EURBTC?amount=100&side=SELL")
+    with pytest.raises(ConnectionError):
+        c._get("/user/current/wallet")
+
+    assert metrics.requests == {
+        ("/quote/{pair}", "GET", "200"): 2,
+        ("/user/current/wallet", "GET", "404"): 1}
+    assert metrics.retries[("/quote/{pair}", "GET")] == 1
+    assert metrics.latencies[("/quote/{pair}", "GET")].count == 2
+
+    prometheus = metrics.to_prometheus()
+    assert "# TYPE revolut_request_duration_seconds histogram" in prometheus
+    assert 'revolut_requests_total{endpoint="/quote/{pair}",method="GET",'\
+        'status="200"} 2' in prometheus
+    assert 'revolut_request_duration_seconds_bucket{endpoint="/quote/{pair}"'\
+        ',method="GET",le="+Inf"} 2' in prometheus
+    assert 'revolut_request_duration_seconds_bucket{endpoint="/quote/{pair}"'\
+        ',method="GET",le="60"} 2' in prometheus
+    assert 'revolut_requests_in_flight{endpoint="/quote/{pair}",'\
+        'method="GET"} 0' in prometheus
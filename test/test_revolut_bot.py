@@ -1,8 +1,14 @@
 import revolut_bot
+from revolut_bot.history import CsvHistory, SqliteHistory, \
+    HistoryBackend, convert_history, open_history
+import revolutbot
 from revolut import Amount, Transaction
 from datetime import datetime
+import json
 import pytest
 import os
+import shutil
+import threading
 
 # To be tested with : python -m pytest -vs test/test_revolut_bot.py
 
@@ -60,6 +66,31 @@ def test_get_last_transactions_from_csv_errors():
             separator="BAD_SEPARATOR")
 
 
+def test_get_last_transaction(tmpdir, monkeypatch):
+    last_tr = revolut_bot.get_last_transaction(
+                        filename="exchange_history_example.csv")
+    assert str(last_tr) == str(revolut_bot.get_last_transactions_from_csv(
+                        filename="exchange_history_example.csv")[-1])
+
+    # Rows longer than a block, and empty lines at the end of the file
+    monkeypatch.setattr(revolut_bot, "_TAIL_BLOCK_SIZE", 7)
+    history_filename = str(tmpdir.join("history.csv"))
+    with open(history_filename, "w") as f:
+        f.write(",".join(revolut_bot._CSV_COLUMNS) + "\r\n")
+        f.write("10/07/2018,16:30:00,10.00,USD,8.66,EUR\r\n")
+        f.write("11/07/2018,16:30:00,8.66,EUR,10.50,USD\n\n")
+    last_tr = revolut_bot.get_last_transaction(filename=history_filename)
+    assert str(last_tr) == "(11/07/2018 16:30:00) 8.66 EUR => 10.50 USD"
+
+    with open(history_filename, "w") as f:
+        f.write(",".join(revolut_bot._CSV_COLUMNS) + "\n")
+    with pytest.raises(IndexError):
+        revolut_bot.get_last_transaction(filename=history_filename)
+
+    with pytest.raises(FileNotFoundError):
+        revolut_bot.get_last_transaction(filename="unknown_file.csv")
+
+
 def test_csv_functions():
     _TEST_CSV_FILENAME = "test_file.csv"
     with open(_TEST_CSV_FILENAME, "w") as f:
@@ -121,3 +152,218 @@ def test_convert_Transaction_to_dict():
                        'hour': '16:30:00',
                        'to_amount': 8.66,
                        'to_currency': 'EUR'}
+
+
+class _StubRevolut:
+    """ Quote with a fixed rate, without network """
+    def __init__(self, rate, stop_event=None):
+        self.rate = rate
+        self.stop_event = stop_event
+        self.exchanges = []
+
+    def quote(self, from_amount, to_currency):
+        if self.stop_event is not None:
+            self.stop_event.set()
+        return Amount(real_amount=from_amount.real_amount * self.rate,
+                      currency=to_currency)
+
+    def quote_many(self, pairs):
+        quotes = {}
+        for from_amount, to_currency in pairs:
+            try:
+                quotes[(from_amount, to_currency)] = self.quote(from_amount,
+                                                                to_currency)
+            except Exception as error:
+                quotes[(from_amount, to_currency)] = error
+        return quotes
+
+    def exchange(self, from_amount, to_currency, simulate=False):
+        self.exchanges.append(from_amount)
+        return Transaction(from_amount=from_amount,
+                           to_amount=self.quote(from_amount, to_currency),
+                           date=datetime.now())
+
+
+def test_buy_or_not():
+    last_tr = revolut_bot.get_last_transactions_from_csv(
+                        filename="exchange_history_example.csv")[-1]
+    # Last transaction : 86.66 EUR => 102.00 USD
+    decision, exchange_transaction = revolutbot.buy_or_not(
+        revolut=_StubRevolut(rate=0.5), last_tr=last_tr, simulate=False)
+    assert decision == revolutbot._RETURN_CODE_DO_NOT_BUY
+    assert exchange_transaction is None
+
+    stub_revolut = _StubRevolut(rate=1)
+    decision, exchange_transaction = revolutbot.buy_or_not(
+        revolut=stub_revolut, last_tr=last_tr, simulate=False)
+    assert decision == revolutbot._RETURN_CODE_BUY
+    assert str(exchange_transaction.to_amount) == "102.00 EUR"
+
+    decision, exchange_transaction = revolutbot.buy_or_not(
+        revolut=stub_revolut, last_tr=last_tr, simulate=True)
+    assert decision == revolutbot._RETURN_CODE_BUY
+    assert exchange_transaction is None
+    assert len(stub_revolut.exchanges) == 1
+
+
+def test_run_daemon(tmpdir):
+    history_filename = str(tmpdir.join("history.csv"))
+    status_filename = str(tmpdir.join("status.json"))
+    shutil.copy("exchange_history_example.csv", history_filename)
+
+    stop_event = threading.Event()
+    revolutbot.run_daemon(revolut=_StubRevolut(rate=1, stop_event=stop_event),
+                          simulate=False, bots=[(history_filename, 1)],
+                          interval=3600, statusfile=status_filename,
+                          stop_event=stop_event)
+
+    with open(status_filename) as f:
+        status = json.load(f)
+    assert status["bots"][history_filename]["decision"] == "BUY"
+    last_tr = revolut_bot.get_last_transactions_from_csv(
+                        filename=history_filename)[-1]
+    assert str(last_tr.to_amount) == "102.00 EUR"
+
+
+def test_buy_or_not_many():
+    last_tr = revolut_bot.get_last_transactions_from_csv(
+                        filename="exchange_history_example.csv")[-1]
+    # Last transaction : 86.66 EUR => 102.00 USD
+    btc_tr = Transaction(from_amount=Amount(real_amount=100, currency="EUR"),
+                         to_amount=Amount(real_amount=0.01, currency="BTC"),
+                         date=datetime.now())
+    stub_revolut = _StubRevolut(rate=0.9)
+    decisions = revolutbot.buy_or_not_many(
+        revolut=stub_revolut,
+        last_transactions={"usd.csv": last_tr, "btc.csv": btc_tr},
+        simulate=False,
+        percent_margins={"usd.csv": 1})
+    # 102.00 USD => 91.80 EUR > 86.66 EUR + 1%
+    assert decisions["usd.csv"][0] == revolutbot._RETURN_CODE_BUY
+    assert str(decisions["usd.csv"][1].to_amount) == "91.80 EUR"
+    # 0.01 BTC => 0.01 EUR
+    assert decisions["btc.csv"] == (revolutbot._RETURN_CODE_DO_NOT_BUY, None)
+    assert len(stub_revolut.exchanges) == 1
+
+    decisions = revolutbot.buy_or_not_many(
+        revolut=stub_revolut,
+        last_transactions={"usd.csv": last_tr},
+        simulate=True,
+        percent_margins={"usd.csv": 10})
+    assert decisions["usd.csv"] == (revolutbot._RETURN_CODE_DO_NOT_BUY, None)
+
+    decisions = revolutbot.buy_or_not_many(
+        revolut=_StubRevolut(rate=None),  # The quote fails
+        last_transactions={"usd.csv": last_tr},
+        simulate=True)
+    assert decisions["usd.csv"] == (revolutbot._RETURN_CODE_ERROR, None)
+
+
+def test_read_bots_config(tmpdir):
+    config_filename = str(tmpdir.join("config.json"))
+    with open(config_filename, "w") as f:
+        json.dump([{"historyfile": "eur_usd.csv", "margin": 2},
+                   {"historyfile": "eur_btc.csv"}], f)
+    assert revolutbot.read_bots_config(config_filename) == [
+        ("eur_usd.csv", 2), ("eur_btc.csv", revolutbot._BOT_PERCENT_MARGIN)]
+
+
+def test_history_backends(tmpdir):
+    csv_filename = str(tmpdir.join("history.csv"))
+    sqlite_filename = str(tmpdir.join("history.sqlite"))
+    shutil.copy("exchange_history_example.csv", csv_filename)
+    transactions = revolut_bot.get_last_transactions_from_csv(
+                        filename=csv_filename)
+
+    assert convert_history(csv_filename, sqlite_filename) == \
+        len(transactions)
+    with open_history(sqlite_filename) as history:
+        assert type(history) == SqliteHistory
+        assert len(history) == len(transactions)
+        assert [str(tr) for tr in history.get_transactions()] == \
+            [str(tr) for tr in transactions]
+        assert str(history.get_last_transaction()) == str(transactions[-1])
+
+        new_tr = Transaction(
+                    from_amount=Amount(real_amount=102, currency="USD"),
+                    to_amount=Amount(real_amount=0.01234567, currency="BTC"),
+                    date=datetime(2018, 7, 20, 9, 0))
+        history.append(new_tr)
+        assert str(history.get_last_transaction()) == str(new_tr)
+        assert [str(tr) for tr in history.get_transactions(
+            from_date=datetime(2018, 7, 20), to_date=datetime(2018, 7, 21))] \
+            == [str(new_tr)]
+
+    # Back to csv, in a new file (with its header)
+    new_csv_filename = str(tmpdir.join("new_history.csv"))
+    convert_history(sqlite_filename, new_csv_filename)
+    with open_history(new_csv_filename) as history:
+        assert type(history) == CsvHistory
+        assert len(history.get_transactions()) == len(transactions) + 1
+        assert str(history.get_last_transaction()) == str(new_tr)
+
+    with pytest.raises(IndexError):
+        SqliteHistory(":memory:").get_last_transaction()
+
+    # An empty csv file gets its header too
+    empty_csv_filename = str(tmpdir.join("empty_history.csv"))
+    open(empty_csv_filename, "w").close()
+    with open_history(empty_csv_filename) as history:
+        history.append(new_tr)
+        assert str(history.get_last_transaction()) == str(new_tr)
+
+    with pytest.raises(TypeError):
+        HistoryBackend()  # Abstract
+
+
+def test_history_conversion_rounding(tmpdir):
+    csv_filename = str(tmpdir.join("history.csv"))
+    sqlite_filename = str(tmpdir.join("history.sqlite"))
+    with open(csv_filename, "w") as f:
+        f.write(",".join(revolut_bot._CSV_COLUMNS) + "\n")
+        f.write("10/07/2018,16:30:00,1.15,USD,0.29,EUR\n")
+        f.write("11/07/2018,16:30:00,0.29,EUR,0.00012345,BTC\n")
+
+    convert_history(csv_filename, sqlite_filename)
+    with open_history(sqlite_filename) as history:
+        assert [str(tr) for tr in history.get_transactions()] == [
+            "(10/07/2018 16:30:00) 1.15 USD => 0.29 EUR",
+            "(11/07/2018 16:30:00) 0.29 EUR => 0.00012345 BTC"]
+
+
+def test_backtest(tmpdir):
+    pytest.importorskip("numpy")
+    from revolut_bot import backtest
+
+    rates_filename = str(tmpdir.join("rates.csv"))
+    with open(rates_filename, "w") as f:
+        f.write("date,EUR/USD,EUR/BTC\n")
+        f.write("2018-07-14,1.40,\n")  # Not sorted
+        f.write("2018-07-13,1.25,\n")
+        f.write("2018-07-10,1.20,0.00020\n")
+        f.write("2018-07-11,1.00,0.00018\n")
+        f.write("2018-07-12,1.30,0.00025\n")
+    series = backtest.load_rates_csv(rates_filename)
+    dates, rates = series[("EUR", "USD")]
+    assert list(rates) == [1.2, 1.0, 1.3, 1.25, 1.4]
+    assert len(series[("EUR", "BTC")][0]) == 3
+
+    # 100 EUR bought for 120 USD, worth 130 USD the 12th
+    result = backtest.backtest(dates, rates, percent_margin=5)
+    assert result["trades"] == 1
+    assert (result["final_amount"], result["final_currency"]) == \
+        (130, "USD")
+    # 130 USD worth 104 EUR the 13th (< 100 EUR + 5%), then 92.86 EUR
+    assert round(result["final_value"], 2) == 92.86
+    assert round(result["max_drawdown_percent"], 2) == 10.71
+    result = backtest.backtest(dates, rates, percent_margin=20)
+    assert result["trades"] == 0
+    assert result["final_value"] == 100
+
+    results = backtest.sweep(series, margins=[1, 20],
+                             start_dates=[None, datetime(2018, 7, 11)],
+                             max_workers=2)
+    assert len(results) == 8
+    assert results[0] == backtest.backtest(dates, rates, percent_margin=1,
+                                           pair=("EUR", "USD"))
+    assert results[3]["start_date"] == "2018-07-11T00:00:00"